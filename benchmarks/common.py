@@ -0,0 +1,84 @@
+################################################################################
+# Shared benchmark helpers
+################################################################################
+import os
+import sys
+import imp
+import json
+import time
+import platform
+import resource
+
+import numpy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAME_SCRIPT = os.path.join(ROOT, 'roguelike-python-tutorial.py')
+
+def load_game():
+    #the game script isn't importable by name, and libtcodpy looks for
+    #./libtcod.so, so load it by path from the top of the repository. the
+    #headless backend keeps windows out of the way.
+    os.environ['ROGUELIKE_HEADLESS'] = '1'
+    os.chdir(ROOT)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return imp.load_source('roguelike', GAME_SCRIPT)
+
+def current_memory_kb():
+    #resident set size right now, where /proc makes that cheap to find out
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except (IOError, OSError):
+        return 0
+
+def peak_memory_kb():
+    #largest resident set size so far (bytes rather than KB on OS X)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+def percentile(values, p):
+    return float(numpy.percentile(values, p))
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def write_results(path, results):
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f,
+                  indent=2, sort_keys=True)
+
+def read_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+def compare(results, baseline, metrics, tolerance):
+    #returns a line for each metric that got worse than the baseline by more
+    #than the tolerance (0.2 = 20%), and for each count that changed at all:
+    #with fixed seeds a different count means the output itself changed
+    old_results = dict((result['name'], result) for result in baseline)
+    problems = []
+    for result in results:
+        old = old_results.get(result['name'])
+        if old is None:
+            continue
+        for metric in metrics:
+            if metric not in result or metric not in old or old[metric] <= 0:
+                continue
+            change = float(result[metric]) / old[metric] - 1.0
+            if change > tolerance:
+                problems.append('%s: %s %.4g -> %.4g (+%d%%)' % (
+                    result['name'], metric, old[metric], result[metric], change * 100))
+        for key in sorted(result.get('counts', {})):
+            if old.get('counts', {}).get(key, result['counts'][key]) != result['counts'][key]:
+                problems.append('%s: %s changed %s -> %s' % (
+                    result['name'], key, old['counts'][key], result['counts'][key]))
+    return problems
@@ -0,0 +1,141 @@
+################################################################################
+# FOV benchmark
+################################################################################
+# Times each FOV engine from a fixed set of open tiles, and counts the cells
+# where shadowcast_fov disagrees with libtcod's FOV_SHADOW and FOV_BASIC (the
+# game's default FOV_ALGO). With the libtcod 1.5.1 that libtcodpy.py wraps,
+# shadowcast_fov and FOV_SHADOW agree; against FOV_BASIC some cells on the
+# edges of shadows differ.
+#
+#   python benchmarks/fov.py                         # run, compare to baseline
+#   python benchmarks/fov.py --save-baseline         # run, store as baseline
+#   python benchmarks/fov.py --radii 10 30 0 --points 20
+#
+# A radius of 0 is the whole map, which is slow for shadowcast_fov on a big one.
+import os
+import sys
+import random
+import argparse
+import timeit
+
+import numpy
+
+import common
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MAP_SIZE = 500
+SEED = 1234
+POINTS = 100
+RADII = [5, 10, 30]
+
+def fov_engines(rl):
+    #(name, engine, FOV_ALGO) for each way of working out FOV. libtcodpy can
+    #only be imported once load_game has put the repository on the path.
+    return [
+        ('libtcod-basic', 'libtcod', rl.libtcod.FOV_BASIC),
+        ('libtcod-shadow', 'libtcod', rl.libtcod.FOV_SHADOW),
+        ('shadowcast', 'shadowcast', None),
+    ]
+
+def pick_points(rl, count, seed):
+    #open tiles to look from, the same ones for every engine
+    open_tiles = numpy.argwhere(~rl.map.block_sight)
+    rng = random.Random(seed)
+    return [tuple(int(v) for v in open_tiles[rng.randrange(len(open_tiles))])
+            for i in range(count)]
+
+def seen_area(rl, fov, x, y, radius):
+    #what an FOV from (x, y) saw of the square its radius reaches, as a [y, x]
+    #array, so the engines' results can be compared cell for cell
+    if radius <= 0:
+        return fov.visible_in(0, 0, rl.MAP_WIDTH, rl.MAP_HEIGHT)
+    return fov.visible_in(x - radius, y - radius, 2 * radius + 1, 2 * radius + 1)
+
+def run_engine(rl, engine, algo, points, radius):
+    if algo is not None:
+        rl.FOV_ALGO = algo
+    times = []
+    results = []
+    for (x, y) in points:
+        began = timeit.default_timer()
+        fov = rl.compute_fov_uncached(x, y, radius, engine)
+        times.append(timeit.default_timer() - began)
+        results.append(seen_area(rl, fov, x, y, radius))
+    return (times, results)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the FOV engines.')
+    parser.add_argument('--radii', type=int, nargs='+', default=RADII, help='sight radii (0 = the whole map)')
+    parser.add_argument('--generator', default='outdoor', choices=['outdoor', 'dungeon', 'debug'])
+    parser.add_argument('--size', type=int, default=MAP_SIZE, help='map width (maps are square)')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--points', type=int, default=POINTS, help='places to look from')
+    parser.add_argument('--output', default=os.path.join(HERE, 'fov-results.json'))
+    parser.add_argument('--baseline', default=os.path.join(HERE, 'fov-baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown, as a fraction (default 0.2)')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline)
+    rl = common.load_game()
+    rl.MAP_WIDTH = rl.MAP_HEIGHT = args.size
+    rl.WORLD_CACHE_DIR = None
+    rl.init_game(args.generator, args.seed)
+    points = pick_points(rl, args.points, args.seed)
+    engines = fov_engines(rl)
+
+    results = []
+    for radius in args.radii:
+        runs = {}
+        for (name, engine, algo) in engines:
+            runs[name] = run_engine(rl, engine, algo, points, radius)
+
+        for (name, engine, algo) in engines:
+            (times, visible) = runs[name]
+            counts = {'visible': int(sum(v.sum() for v in visible))}
+            for (other, other_engine, other_algo) in engines:
+                if other != name:
+                    counts['differs_from_' + other] = int(sum(
+                        (a != b).sum() for (a, b) in zip(visible, runs[other][1])))
+
+            result = {
+                'name': '%s/%dx%d/radius=%d/%s' % (args.generator, args.size, args.size, radius, name),
+                'generator': args.generator, 'size': args.size, 'radius': radius,
+                'engine': engine, 'algo': algo, 'seed': args.seed, 'points': len(points),
+                'fov_time_p50': common.percentile(times, 50),
+                'fov_time_p95': common.percentile(times, 95),
+                'fov_time_mean': float(numpy.mean(times)),
+                'counts': counts,
+            }
+            results.append(result)
+            print '%-45s p50 %8.3fms  p95 %8.3fms  %8d visible  %s' % (
+                result['name'], result['fov_time_p50'] * 1000, result['fov_time_p95'] * 1000,
+                counts['visible'], ' '.join('%s=%d' % (key[len('differs_from_'):], counts[key])
+                                            for key in sorted(counts) if key != 'visible'))
+            sys.stdout.flush()
+
+    common.write_results(output, results)
+    print 'results written to', output
+
+    if args.save_baseline:
+        common.write_results(baseline, results)
+        print 'baseline written to', baseline
+        return 0
+
+    if not os.path.exists(baseline):
+        print 'no baseline at', baseline, '(run with --save-baseline to make one)'
+        return 0
+
+    problems = common.compare(results, common.read_results(baseline),
+                              ['fov_time_p50', 'fov_time_p95'], args.tolerance)
+    for problem in problems:
+        print 'REGRESSION', problem
+    if not problems:
+        print 'no regressions against', baseline
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
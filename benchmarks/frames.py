@@ -0,0 +1,212 @@
+################################################################################
+# Frame time benchmark
+################################################################################
+# Drives render_frame() on the headless backend along scripted camera paths,
+# with extra monsters scattered over the map, and reports p50/p95/p99 frame
+# times and libtcod calls per frame. Each of those calls is a ctypes call into
+# libtcod on the real backend, so the counts are what a window would pay.
+#
+#   python benchmarks/frames.py                      # run, compare to baseline
+#   python benchmarks/frames.py --save-baseline      # run, store as baseline
+#   python benchmarks/frames.py --paths walk --densities 0 5
+#
+# Timing and counting are separate passes, so the counting doesn't slow down
+# the frames being timed.
+import os
+import sys
+import types
+import random
+import argparse
+import timeit
+
+import numpy
+
+import common
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MAP_SIZE = 500
+SEED = 1234
+FRAMES = 200
+WARMUP_FRAMES = 5
+
+# extra monsters per 100 open tiles
+DENSITIES = [0, 1, 5]
+
+################################################################################
+# Camera paths
+################################################################################
+# Each path moves the player (and so the camera, which follows them) once per
+# frame. Moving asks for a new FOV, which is what makes render_all redraw.
+def path_idle(rl, frame, rng):
+    #nothing moves: the cheapest frame
+    pass
+
+def path_walk(rl, frame, rng):
+    #one tile at a time, back and forth across the map
+    step = 1 if (frame // (rl.MAP_WIDTH - 2)) % 2 == 0 else -1
+    walk_to(rl, rl.player.x + step, rl.player.y)
+
+def path_diagonal(rl, frame, rng):
+    step = 1 if (frame // (min(rl.MAP_WIDTH, rl.MAP_HEIGHT) - 2)) % 2 == 0 else -1
+    walk_to(rl, rl.player.x + step, rl.player.y + step)
+
+def path_teleport(rl, frame, rng):
+    #somewhere new every frame: nothing seen in the last frame is reused
+    walk_to(rl, rng.randint(0, rl.MAP_WIDTH - 1), rng.randint(0, rl.MAP_HEIGHT - 1))
+
+PATHS = {
+    'idle': path_idle,
+    'walk': path_walk,
+    'diagonal': path_diagonal,
+    'teleport': path_teleport,
+}
+
+def walk_to(rl, x, y):
+    #the player is only steering the camera here, so walls don't stop them
+    x = min(max(x, 1), rl.MAP_WIDTH - 2)
+    y = min(max(y, 1), rl.MAP_HEIGHT - 2)
+    rl.move_object(rl.player, x, y)
+    rl.need_fov_refresh = True
+
+################################################################################
+# Set-up
+################################################################################
+def add_monsters(rl, density, seed):
+    #scatter orcs over open tiles until there are density per 100 of them
+    open_tiles = numpy.argwhere(~rl.map.occupied)
+    count = len(open_tiles) * density // 100
+    picked = numpy.random.RandomState(seed).permutation(len(open_tiles))[:count]
+    for (x, y) in open_tiles[picked]:
+        rl.spawn('orc', int(x), int(y))
+
+def start_world(rl, generator, size, density, seed):
+    rl.MAP_WIDTH = rl.MAP_HEIGHT = size
+    rl.WORLD_CACHE_DIR = None
+    rl.init_game(generator, seed)
+    add_monsters(rl, density, seed)
+    return (rl.player.x, rl.player.y)
+
+def start_path(rl, start):
+    #every path sets off from the same place with nothing explored yet
+    rl.move_object(rl.player, start[0], start[1])
+    rl.map.explored[:] = False
+    rl.need_fov_refresh = True
+
+class CallCounter:
+    #stands in for the libtcod module, counting calls to its functions
+    def __init__(self, module):
+        self.module = module
+        self.counts = {}
+
+    def __getattr__(self, name):
+        value = getattr(self.module, name)
+        if not isinstance(value, types.FunctionType):
+            return value
+
+        counts = self.counts
+        def counted(*args, **kwargs):
+            counts[name] = counts.get(name, 0) + 1
+            return value(*args, **kwargs)
+        return counted
+
+def run_path(rl, start, path, frames, warmup, seed):
+    move = PATHS[path]
+
+    #timing pass
+    start_path(rl, start)
+    rng = random.Random(seed)
+    times = []
+    for frame in range(warmup + frames):
+        move(rl, frame, rng)
+        began = timeit.default_timer()
+        rl.render_frame()
+        if frame >= warmup:
+            times.append(timeit.default_timer() - began)
+
+    #counting pass, over the same frames
+    start_path(rl, start)
+    rng = random.Random(seed)
+    libtcod = rl.libtcod
+    rl.libtcod = counter = CallCounter(libtcod)
+    try:
+        for frame in range(warmup + frames):
+            move(rl, frame, rng)
+            if frame == warmup:
+                counter.counts.clear()
+            rl.render_frame()
+    finally:
+        rl.libtcod = libtcod
+
+    calls = dict((name, float(count) / frames) for (name, count) in counter.counts.items())
+    return {
+        'frames': frames,
+        'frame_time_p50': common.percentile(times, 50),
+        'frame_time_p95': common.percentile(times, 95),
+        'frame_time_p99': common.percentile(times, 99),
+        'frame_time_mean': float(numpy.mean(times)),
+        'frame_time_max': max(times),
+        'calls_per_frame': sum(calls.values()),
+        'calls_per_frame_by_function': calls,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark frame rendering.')
+    parser.add_argument('--paths', nargs='+', choices=sorted(PATHS), default=sorted(PATHS))
+    parser.add_argument('--densities', type=int, nargs='+', default=DENSITIES,
+                        help='extra monsters per 100 open tiles')
+    parser.add_argument('--generator', default='outdoor', choices=['outdoor', 'dungeon', 'debug'])
+    parser.add_argument('--size', type=int, default=MAP_SIZE, help='map width (maps are square)')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--warmup', type=int, default=WARMUP_FRAMES)
+    parser.add_argument('--output', default=os.path.join(HERE, 'frames-results.json'))
+    parser.add_argument('--baseline', default=os.path.join(HERE, 'frames-baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown or extra calls, as a fraction (default 0.2)')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline)
+    rl = common.load_game()
+
+    results = []
+    for density in args.densities:
+        start = start_world(rl, args.generator, args.size, density, args.seed)
+        for path in args.paths:
+            result = {
+                'name': '%s/%dx%d/%s/density=%d' % (args.generator, args.size, args.size, path, density),
+                'generator': args.generator, 'size': args.size, 'path': path,
+                'density': density, 'seed': args.seed, 'objects': len(rl.objects),
+            }
+            result.update(run_path(rl, start, path, args.frames, args.warmup, args.seed))
+            results.append(result)
+            print '%-40s p50 %7.2fms  p95 %7.2fms  p99 %7.2fms  %8.1f calls/frame' % (
+                result['name'], result['frame_time_p50'] * 1000, result['frame_time_p95'] * 1000,
+                result['frame_time_p99'] * 1000, result['calls_per_frame'])
+            sys.stdout.flush()
+
+    common.write_results(output, results)
+    print 'results written to', output
+
+    if args.save_baseline:
+        common.write_results(baseline, results)
+        print 'baseline written to', baseline
+        return 0
+
+    if not os.path.exists(baseline):
+        print 'no baseline at', baseline, '(run with --save-baseline to make one)'
+        return 0
+
+    problems = common.compare(results, common.read_results(baseline),
+                              ['frame_time_p50', 'frame_time_p95', 'frame_time_p99', 'calls_per_frame'],
+                              args.tolerance)
+    for problem in problems:
+        print 'REGRESSION', problem
+    if not problems:
+        print 'no regressions against', baseline
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+################################################################################
+# Map generation benchmark
+################################################################################
+# Times the map generators, make_fov_map and place_objects over a matrix of
+# map sizes and room counts with fixed seeds. Each case runs in a fresh process
+# so its peak memory isn't hidden by the cases before it.
+#
+#   python benchmarks/mapgen.py                      # run, compare to baseline
+#   python benchmarks/mapgen.py --save-baseline      # run, store as baseline
+#   python benchmarks/mapgen.py --quick --only make_map
+#
+# Results are written as JSON. Cases that got slower or bigger than the
+# baseline by more than --tolerance, or whose object counts changed, are listed
+# and make the script exit with status 1.
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+import common
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SIZES = [100, 250, 500, 1000, 2000]
+QUICK_SIZES = [100, 500]
+ROOM_COUNTS = [50, 450, 2000]
+QUICK_ROOM_COUNTS = [450]
+SEED = 1234
+
+BENCHMARKS = ['make_map', 'make_outdoor_map', 'make_debug_map', 'make_fov_map', 'place_objects']
+
+# make_debug_map and make_fov_map don't lay out rooms, so they only vary by size
+USES_ROOMS = ['make_map', 'make_outdoor_map', 'place_objects']
+
+def cases(benchmarks, sizes, room_counts, seed):
+    for benchmark in benchmarks:
+        for size in sizes:
+            for rooms in (room_counts if benchmark in USES_ROOMS else [None]):
+                name = '%s/%dx%d' % (benchmark, size, size)
+                if rooms is not None:
+                    name += '/rooms=%d' % rooms
+                yield {'name': name, 'benchmark': benchmark, 'size': size,
+                       'rooms': rooms, 'seed': seed}
+
+def setup_world(rl, case):
+    rl.MAP_WIDTH = rl.MAP_HEIGHT = case['size']
+    if case['rooms'] is not None:
+        rl.MAX_ROOMS = case['rooms']
+    rl.reset_objects()
+
+def prepare(rl, case):
+    #untimed work a case needs first; returns the function to time
+    benchmark, seed = case['benchmark'], case['seed']
+    setup_world(rl, case)
+
+    if benchmark == 'make_fov_map':
+        rl.make_map(seed)
+        return rl.make_fov_map
+
+    if benchmark == 'place_objects':
+        #carve the rooms, then time filling them
+        rl.map = rl.TileMap(rl.MAP_WIDTH, rl.MAP_HEIGHT, True, 'WALL_STONE')
+        rl.map.add_blockers(rl.objects)
+        rng = rl.libtcod.random_new_from_seed(seed)
+        rooms = []
+        for room in rl.generate_rooms(rng):
+            rl.create_room(room)
+            rooms.append(room)
+        rl.libtcod.random_delete(rng)
+
+        def place_all():
+            rng = rl.libtcod.random_new_from_seed(seed)
+            for room in rooms:
+                rl.place_objects(room, rng)
+            rl.libtcod.random_delete(rng)
+        return place_all
+
+    generator = getattr(rl, benchmark)
+    return lambda: generator(seed)
+
+def run_case(args):
+    case, repeat = args
+    rl = common.load_game()
+
+    times = []
+    start_memory = common.current_memory_kb()
+    for i in range(repeat):
+        run = prepare(rl, case)
+        start = time.time()
+        run()
+        times.append(time.time() - start)
+
+    counts = {'objects': len(rl.objects)}
+    for object in rl.objects:
+        if object.kind is not None:
+            counts[object.kind] = counts.get(object.kind, 0) + 1
+
+    result = dict(case)
+    result.update({
+        'repeat': repeat,
+        'wall_time': min(times),
+        'wall_time_median': common.percentile(times, 50),
+        'peak_memory_kb': common.peak_memory_kb(),
+        'memory_growth_kb': max(common.peak_memory_kb() - start_memory, 0),
+        'counts': counts,
+    })
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark map generation.')
+    parser.add_argument('--only', action='append', choices=BENCHMARKS,
+                        help='run just this benchmark (can be repeated)')
+    parser.add_argument('--sizes', type=int, nargs='+', help='map widths (maps are square)')
+    parser.add_argument('--rooms', type=int, nargs='+', help='MAX_ROOMS values')
+    parser.add_argument('--quick', action='store_true', help='a small matrix for a fast check')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the fastest is kept')
+    parser.add_argument('--output', default=os.path.join(HERE, 'mapgen-results.json'))
+    parser.add_argument('--baseline', default=os.path.join(HERE, 'mapgen-baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown or memory growth, as a fraction (default 0.2)')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline)
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    room_counts = args.rooms or (QUICK_ROOM_COUNTS if args.quick else ROOM_COUNTS)
+
+    results = []
+    for case in cases(args.only or BENCHMARKS, sizes, room_counts, args.seed):
+        #a new worker per case, so the peak memory is this case's own
+        pool = multiprocessing.Pool(1)
+        try:
+            result = pool.apply(run_case, ((case, args.repeat),))
+        finally:
+            pool.close()
+            pool.join()
+        results.append(result)
+        print '%-40s %9.4fs %9d KB %8d objects' % (
+            result['name'], result['wall_time'], result['memory_growth_kb'],
+            result['counts']['objects'])
+        sys.stdout.flush()
+
+    common.write_results(output, results)
+    print 'results written to', output
+
+    if args.save_baseline:
+        common.write_results(baseline, results)
+        print 'baseline written to', baseline
+        return 0
+
+    if not os.path.exists(baseline):
+        print 'no baseline at', baseline, '(run with --save-baseline to make one)'
+        return 0
+
+    problems = common.compare(results, common.read_results(baseline),
+                              ['wall_time', 'memory_growth_kb'], args.tolerance)
+    for problem in problems:
+        print 'REGRESSION', problem
+    if not problems:
+        print 'no regressions against', baseline
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
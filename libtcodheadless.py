@@ -0,0 +1,477 @@
+#
+# headless stand-in for the console and input parts of libtcodpy.
+#
+# everything else (colors, random numbers, noise, fov...) is libtcodpy's own,
+# so the game behaves exactly the same, but consoles live in memory as NumPy
+# arrays and keyboard input comes from a script instead of a window. use it
+# for benchmarks, tests and simulations on machines without a display:
+#
+#   import libtcodheadless as libtcod
+#   libtcod.queue_keys('kkhh.')
+#
+# the root console is kept after every console_flush, see last_frame and
+# console_as_text.
+#
+
+import textwrap
+import numpy
+from libtcodpy import *
+
+class Console:
+    # an off-screen console: one array for the characters, and one RGB array
+    # each for foreground and background colors, all indexed [y, x].
+    def __init__(self, w, h):
+        self.width = w
+        self.height = h
+        self.ch = numpy.zeros((h, w), dtype=numpy.int32)
+        self.ch.fill(ord(' '))
+        self.fg = numpy.zeros((h, w, 3), dtype=numpy.uint8)
+        self.bg = numpy.zeros((h, w, 3), dtype=numpy.uint8)
+        self.default_fg = (255, 255, 255)
+        self.default_bg = (0, 0, 0)
+        self.bkgnd_flag = BKGND_NONE
+        self.alignment = LEFT
+        self.key_color = None
+
+    def copy(self):
+        other = Console(self.width, self.height)
+        other.ch[:] = self.ch
+        other.fg[:] = self.fg
+        other.bg[:] = self.bg
+        return other
+
+_root = None
+_fullscreen = False
+
+# scripted keyboard input, whether the game has shown a frame since it took
+# the last key, and whether it has asked for a key after the last one. the
+# window counts as closed once the script has run out and either has happened,
+# so the last frame is shown even when the last key doesn't lead to one.
+_keys = []
+_flushed_since_last_key = False
+_asked_past_end = False
+
+# the root console as it was at the last console_flush, and how many flushes
+# there have been
+last_frame = None
+frame_count = 0
+
+def _console(con):
+    if isinstance(con, Console):
+        return con
+    return _root
+
+def _rgb(col):
+    return (col.r, col.g, col.b)
+
+def _blend(old, new, flag):
+    # the background blending modes, for one cell or a whole array of them
+    mode = flag & 0xff
+    alpha = ((flag >> 8) & 0xff) / 255.0
+    old = numpy.asarray(old, dtype=numpy.int32)
+    new = numpy.asarray(new, dtype=numpy.int32)
+    if mode == BKGND_NONE:
+        result = old
+    elif mode == BKGND_MULTIPLY:
+        result = old * new // 255
+    elif mode == BKGND_LIGHTEN:
+        result = numpy.maximum(old, new)
+    elif mode == BKGND_DARKEN:
+        result = numpy.minimum(old, new)
+    elif mode == BKGND_SCREEN:
+        result = 255 - (255 - old) * (255 - new) // 255
+    elif mode == BKGND_ADD:
+        result = old + new
+    elif mode == BKGND_ALPH:
+        result = old + (new - old) * alpha
+    elif mode == BKGND_ADDA:
+        result = old + new * alpha
+    else:
+        result = new
+    return numpy.clip(result, 0, 255).astype(numpy.uint8)
+
+def _flag(c, flag):
+    if flag == BKGND_DEFAULT:
+        return c.bkgnd_flag
+    return flag
+
+def _char_code(c):
+    if type(c) == str or type(c) == bytes:
+        return ord(c)
+    return c
+
+############################
+# scripted input
+############################
+_KEY_NAMES = {
+    '\x1b': KEY_ESCAPE,
+    '\r': KEY_ENTER,
+    '\n': KEY_ENTER,
+    '\t': KEY_TAB,
+    '\b': KEY_BACKSPACE,
+    ' ': KEY_SPACE,
+}
+
+def key_for_char(char):
+    # the Key a real keyboard would report for this character
+    k = Key()
+    k.vk = _KEY_NAMES.get(char, KEY_CHAR)
+    k.c = ord(char)
+    k.pressed = True
+    return k
+
+def queue_keys(keys):
+    # add keys to the input script: a string (one key per character, '\x1b'
+    # for escape) or Key instances
+    global _asked_past_end
+    _asked_past_end = False
+    for key in keys:
+        if not isinstance(key, Key):
+            key = key_for_char(key)
+        _keys.append(key)
+
+def _next_key():
+    global _flushed_since_last_key, _asked_past_end
+    if not _keys:
+        _asked_past_end = True
+        return Key()
+    _flushed_since_last_key = False
+    return _keys.pop(0)
+
+def console_wait_for_keypress(flush):
+    # nothing can be waited for: an empty script gives KEY_NONE
+    return _next_key()
+
+def console_check_for_keypress(flags=KEY_RELEASED):
+    return _next_key()
+
+def console_is_key_pressed(key):
+    return False
+
+def console_set_keyboard_repeat(initial_delay, interval):
+    pass
+
+def console_disable_keyboard_repeat():
+    pass
+
+############################
+# console module
+############################
+def console_init_root(w, h, title, fullscreen=False, renderer=RENDERER_SDL):
+    global _root, _fullscreen, last_frame
+    _root = Console(w, h)
+    _fullscreen = fullscreen
+    last_frame = _root.copy()
+
+def console_set_custom_font(fontFile, flags=FONT_LAYOUT_ASCII_INCOL, nb_char_horiz=0, nb_char_vertic=0):
+    pass
+
+def console_map_ascii_code_to_font(asciiCode, fontCharX, fontCharY):
+    pass
+
+def console_map_ascii_codes_to_font(firstAsciiCode, nbCodes, fontCharX, fontCharY):
+    pass
+
+def console_map_string_to_font(s, fontCharX, fontCharY):
+    pass
+
+def console_is_fullscreen():
+    return _fullscreen
+
+def console_set_fullscreen(fullscreen):
+    global _fullscreen
+    _fullscreen = fullscreen
+
+def console_is_window_closed():
+    return not _keys and (_flushed_since_last_key or _asked_past_end)
+
+def console_set_window_title(title):
+    pass
+
+def console_flush():
+    global last_frame, frame_count, _flushed_since_last_key
+    last_frame = _root.copy()
+    frame_count += 1
+    _flushed_since_last_key = True
+
+def console_as_text(con=0):
+    # the characters of a console (or of last_frame) as lines of text
+    c = _console(con)
+    return '\n'.join(''.join(chr(code) if 32 <= code < 127 else ' ' for code in row)
+                     for row in c.ch)
+
+def console_new(w, h):
+    return Console(w, h)
+
+def console_delete(con):
+    pass
+
+def console_get_width(con):
+    return _console(con).width
+
+def console_get_height(con):
+    return _console(con).height
+
+def console_set_default_background(con, col):
+    _console(con).default_bg = _rgb(col)
+
+def console_set_default_foreground(con, col):
+    _console(con).default_fg = _rgb(col)
+
+def console_get_default_background(con):
+    return Color(*_console(con).default_bg)
+
+def console_get_default_foreground(con):
+    return Color(*_console(con).default_fg)
+
+def console_set_background_flag(con, flag):
+    _console(con).bkgnd_flag = flag
+
+def console_get_background_flag(con):
+    return _console(con).bkgnd_flag
+
+def console_set_alignment(con, alignment):
+    _console(con).alignment = alignment
+
+def console_get_alignment(con):
+    return _console(con).alignment
+
+def console_clear(con):
+    c = _console(con)
+    c.ch.fill(ord(' '))
+    c.fg[:] = c.default_fg
+    c.bg[:] = c.default_bg
+
+def _in_bounds(c, x, y):
+    return 0 <= x < c.width and 0 <= y < c.height
+
+def console_put_char(con, x, y, c, flag=BKGND_DEFAULT):
+    cons = _console(con)
+    if not _in_bounds(cons, x, y):
+        return
+    cons.ch[y, x] = _char_code(c)
+    cons.fg[y, x] = cons.default_fg
+    cons.bg[y, x] = _blend(cons.bg[y, x], cons.default_bg, _flag(cons, flag))
+
+def console_put_char_ex(con, x, y, c, fore, back):
+    cons = _console(con)
+    if not _in_bounds(cons, x, y):
+        return
+    cons.ch[y, x] = _char_code(c)
+    cons.fg[y, x] = _rgb(fore)
+    cons.bg[y, x] = _rgb(back)
+
+def console_set_char_background(con, x, y, col, flag=BKGND_SET):
+    cons = _console(con)
+    if _in_bounds(cons, x, y):
+        cons.bg[y, x] = _blend(cons.bg[y, x], _rgb(col), flag)
+
+def console_set_char_foreground(con, x, y, col):
+    cons = _console(con)
+    if _in_bounds(cons, x, y):
+        cons.fg[y, x] = _rgb(col)
+
+def console_set_char(con, x, y, c):
+    cons = _console(con)
+    if _in_bounds(cons, x, y):
+        cons.ch[y, x] = _char_code(c)
+
+def console_get_char(con, x, y):
+    return int(_console(con).ch[y, x])
+
+def console_get_char_background(con, x, y):
+    return Color(*_console(con).bg[y, x])
+
+def console_get_char_foreground(con, x, y):
+    return Color(*_console(con).fg[y, x])
+
+def console_rect(con, x, y, w, h, clr, flag=BKGND_DEFAULT):
+    cons = _console(con)
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + w, cons.width), min(y + h, cons.height)
+    if x1 >= x2 or y1 >= y2:
+        return
+    area = numpy.s_[y1:y2, x1:x2]
+    cons.bg[area] = _blend(cons.bg[area], cons.default_bg, _flag(cons, flag))
+    if clr:
+        cons.ch[area] = ord(' ')
+
+def console_hline(con, x, y, l, flag=BKGND_DEFAULT):
+    for i in range(l):
+        console_put_char(con, x + i, y, 196, flag)
+
+def console_vline(con, x, y, l, flag=BKGND_DEFAULT):
+    for i in range(l):
+        console_put_char(con, x, y + i, 179, flag)
+
+def _wrap(fmt, w):
+    # split text into lines at most w wide, like libtcod's rectangle printing
+    lines = []
+    for paragraph in fmt.split('\n'):
+        if w > 0:
+            lines.extend(textwrap.wrap(paragraph, w) or [''])
+        else:
+            lines.append(paragraph)
+    return lines
+
+def _print_lines(cons, x, y, w, h, flag, alignment, lines):
+    if h > 0:
+        lines = lines[:h]
+    for line in lines:
+        if alignment == CENTER:
+            start = x - len(line) // 2
+        elif alignment == RIGHT:
+            start = x - len(line) + 1
+        else:
+            start = x
+        for i, char in enumerate(line):
+            console_put_char(cons, start + i, y, char, flag)
+        y += 1
+    return len(lines)
+
+def console_print(con, x, y, fmt):
+    cons = _console(con)
+    _print_lines(cons, x, y, 0, 0, cons.bkgnd_flag, cons.alignment, fmt.split('\n'))
+
+def console_print_ex(con, x, y, flag, alignment, fmt):
+    _print_lines(_console(con), x, y, 0, 0, flag, alignment, fmt.split('\n'))
+
+def console_print_rect(con, x, y, w, h, fmt):
+    cons = _console(con)
+    return _print_lines(cons, x, y, w, h, cons.bkgnd_flag, cons.alignment, _wrap(fmt, w))
+
+def console_print_rect_ex(con, x, y, w, h, flag, alignment, fmt):
+    return _print_lines(_console(con), x, y, w, h, flag, alignment, _wrap(fmt, w))
+
+def console_get_height_rect(con, x, y, w, h, fmt):
+    lines = _wrap(fmt, w)
+    if h > 0:
+        return min(len(lines), h)
+    return len(lines)
+
+def console_print_frame(con, x, y, w, h, clear=True, flag=BKGND_DEFAULT, fmt=0):
+    cons = _console(con)
+    if clear:
+        console_rect(con, x, y, w, h, True, flag)
+    for i in range(1, w - 1):
+        console_put_char(con, x + i, y, 196, flag)
+        console_put_char(con, x + i, y + h - 1, 196, flag)
+    for j in range(1, h - 1):
+        console_put_char(con, x, y + j, 179, flag)
+        console_put_char(con, x + w - 1, y + j, 179, flag)
+    for (cx, cy, char) in ((x, y, 218), (x + w - 1, y, 191),
+                           (x, y + h - 1, 192), (x + w - 1, y + h - 1, 217)):
+        console_put_char(con, cx, cy, char, flag)
+    if fmt:
+        console_print_ex(con, x + w // 2, y, BKGND_SET, CENTER, ' %s ' % fmt)
+
+def console_set_key_color(con, col):
+    _console(con).key_color = _rgb(col)
+
+def console_blit(src, x, y, w, h, dst, xdst, ydst, ffade=1.0, bfade=1.0):
+    s = _console(src)
+    d = _console(dst)
+    if w == 0:
+        w = s.width
+    if h == 0:
+        h = s.height
+
+    # clip the rectangle to both consoles
+    if x < 0: w, xdst, x = w + x, xdst - x, 0
+    if y < 0: h, ydst, y = h + y, ydst - y, 0
+    if xdst < 0: w, x, xdst = w + xdst, x - xdst, 0
+    if ydst < 0: h, y, ydst = h + ydst, y - ydst, 0
+    w = min(w, s.width - x, d.width - xdst)
+    h = min(h, s.height - y, d.height - ydst)
+    if w <= 0 or h <= 0:
+        return
+
+    src_area = numpy.s_[y:y + h, x:x + w]
+    dst_area = numpy.s_[ydst:ydst + h, xdst:xdst + w]
+    ch, fg, bg = s.ch[src_area].copy(), s.fg[src_area].copy(), s.bg[src_area].copy()
+
+    # cells whose background is the key color are transparent
+    copied = numpy.ones((h, w), dtype=numpy.bool_)
+    if s.key_color is not None:
+        copied = (bg != s.key_color).any(axis=2)
+
+    if ffade == 1.0 and bfade == 1.0:
+        d.ch[dst_area][copied] = ch[copied]
+        d.fg[dst_area][copied] = fg[copied]
+        d.bg[dst_area][copied] = bg[copied]
+        return
+
+    # faded blit, following libtcod's rules for mixing the characters
+    dch, dfg, dbg = d.ch[dst_area], d.fg[dst_area], d.bg[dst_area]
+    def lerp(a, b, t):
+        return (a + (b.astype(numpy.float32) - a) * t).astype(numpy.uint8)
+
+    new_bg = lerp(dbg, bg, bfade)
+    new_ch = dch.copy()
+    new_fg = dfg.copy()
+    space = ch == ord(' ')
+    onto_space = ~space & (dch == ord(' '))
+    same = ~space & ~onto_space & (dch == ch)
+    other = ~space & ~onto_space & ~same
+
+    new_fg[space] = lerp(dfg, bg, bfade)[space]
+    new_ch[onto_space] = ch[onto_space]
+    new_fg[onto_space] = lerp(new_bg, fg, ffade)[onto_space]
+    new_fg[same] = lerp(dfg, fg, ffade)[same]
+    if ffade < 0.5:
+        new_fg[other] = lerp(dfg, new_bg, ffade * 2)[other]
+    else:
+        new_ch[other] = ch[other]
+        new_fg[other] = lerp(new_bg, fg, (ffade - 0.5) * 2)[other]
+
+    dch[copied] = new_ch[copied]
+    dfg[copied] = new_fg[copied]
+    dbg[copied] = new_bg[copied]
+
+# fast color filling: flat row-major sequences, as in libtcodpy
+def console_fill_foreground(con, r, g, b):
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    cons = _console(con)
+    rgb = numpy.column_stack((r, g, b)).reshape(cons.height, cons.width, 3)
+    cons.fg[:] = numpy.clip(rgb, 0, 255)
+
+def console_fill_background(con, r, g, b):
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    cons = _console(con)
+    rgb = numpy.column_stack((r, g, b)).reshape(cons.height, cons.width, 3)
+    cons.bg[:] = numpy.clip(rgb, 0, 255)
+
+def console_fill_char(con, arr):
+    cons = _console(con)
+    cons.ch[:] = numpy.asarray(arr).reshape(cons.height, cons.width)
+
+############################
+# sys module
+############################
+_fps = 0
+
+def sys_set_fps(fps):
+    global _fps
+    _fps = fps
+
+def sys_get_fps():
+    return _fps
+
+def sys_sleep_milli(val):
+    pass
+
+def sys_check_for_event(mask, k, m):
+    #like libtcod, k is reset when there is no key to report
+    if not mask & EVENT_KEY_PRESS or not _keys:
+        if mask & EVENT_KEY_PRESS:
+            _next_key()
+        pointer(k)[0] = Key()
+        return 0
+    pointer(k)[0] = _next_key()
+    return EVENT_KEY_PRESS
+
+def sys_wait_for_event(mask, k, m, flush):
+    # like sys_check_for_event: with no window there is nothing to wait for
+    return sys_check_for_event(mask, k, m)
@@ -914,9 +914,9 @@ def console_fill_foreground(con,r,g,b) :
     if (numpy_available and isinstance(r, numpy.ndarray) and
         isinstance(g, numpy.ndarray) and isinstance(b, numpy.ndarray)):
         #numpy arrays, use numpy's ctypes functions
-        r = numpy.ascontiguousarray(r, dtype=numpy.int_)
-        g = numpy.ascontiguousarray(g, dtype=numpy.int_)
-        b = numpy.ascontiguousarray(b, dtype=numpy.int_)
+        r = numpy.ascontiguousarray(r, dtype=numpy.intc)
+        g = numpy.ascontiguousarray(g, dtype=numpy.intc)
+        b = numpy.ascontiguousarray(b, dtype=numpy.intc)
         cr = r.ctypes.data_as(POINTER(c_int))
         cg = g.ctypes.data_as(POINTER(c_int))
         cb = b.ctypes.data_as(POINTER(c_int))
@@ -935,9 +935,9 @@ def console_fill_background(con,r,g,b) :
     if (numpy_available and isinstance(r, numpy.ndarray) and
         isinstance(g, numpy.ndarray) and isinstance(b, numpy.ndarray)):
         #numpy arrays, use numpy's ctypes functions
-        r = numpy.ascontiguousarray(r, dtype=numpy.int_)
-        g = numpy.ascontiguousarray(g, dtype=numpy.int_)
-        b = numpy.ascontiguousarray(b, dtype=numpy.int_)
+        r = numpy.ascontiguousarray(r, dtype=numpy.intc)
+        g = numpy.ascontiguousarray(g, dtype=numpy.intc)
+        b = numpy.ascontiguousarray(b, dtype=numpy.intc)
         cr = r.ctypes.data_as(POINTER(c_int))
         cg = g.ctypes.data_as(POINTER(c_int))
         cb = b.ctypes.data_as(POINTER(c_int))
@@ -952,7 +952,7 @@ def console_fill_background(con,r,g,b) :
 def console_fill_char(con,arr) :
     if (numpy_available and isinstance(arr, numpy.ndarray) ):
         #numpy arrays, use numpy's ctypes functions
-        arr = numpy.ascontiguousarray(arr, dtype=numpy.int_)
+        arr = numpy.ascontiguousarray(arr, dtype=numpy.intc)
         carr = arr.ctypes.data_as(POINTER(c_int))
     else:
         #otherwise convert using the struct module
@@ -1482,6 +1482,27 @@ def noise_get_fbm(n, f, oc, typ=NOISE_DEFAULT):
 def noise_get_turbulence(n, f, oc, typ=NOISE_DEFAULT):
     return _lib.TCOD_noise_get_turbulence_ex(n, _NOISE_PACKER_FUNC[len(f)](*f), c_float(oc), typ)
 
+def noise_get_array(n, w, h, scalex, scaley, offsetx=0.0, offsety=0.0, typ=NOISE_DEFAULT):
+    # samples a whole w*h grid in one call, at f = ((x + offsetx) * scalex,
+    # (y + offsety) * scaley). the grid is filled by the heightmap fbm code
+    # with a single octave, which is the plain noise value clamped to
+    # +-0.99999. a typ other than NOISE_DEFAULT becomes the generator's
+    # default type, as with noise_set_type.
+    # returns a (h, w) NumPy float32 array, or a flat row-major list
+    # (index x+y*w) without NumPy.
+    if typ != NOISE_DEFAULT:
+        noise_set_type(n, typ)
+    hm = heightmap_new(w, h)
+    heightmap_add_fbm(hm, n, scalex * w, scaley * h, offsetx, offsety, 1.0, 0.0, 1.0)
+    values = hm.p.contents.values
+    if numpy_available:
+        samples = numpy.frombuffer(string_at(values, sizeof(c_float) * w * h),
+                                   dtype=numpy.float32).reshape(h, w).copy()
+    else:
+        samples = values[:w * h]
+    heightmap_delete(hm)
+    return samples
+
 def noise_delete(n):
     _lib.TCOD_noise_delete(n)
 
@@ -1543,6 +1564,73 @@ def map_get_width(map):
 def map_get_height(map):
     return _lib.TCOD_map_get_height(map)
 
+# bulk access to the map cells. mirrors libtcod's internal map_t, whose
+# cell_t packs transparent, walkable and fov into one byte as bitfields.
+class _CMap(Structure):
+    _fields_=[('width', c_int),
+              ('height', c_int),
+              ('nbcells', c_int),
+              ('cells', POINTER(c_uint8)),
+              ]
+
+_MAP_CELL_TRANSPARENT = 1
+_MAP_CELL_WALKABLE = 2
+_MAP_CELL_FOV = 4
+
+def _map_contents(m):
+    return cast(c_void_p(m), POINTER(_CMap)).contents
+
+def _map_array_size(a):
+    if numpy_available and isinstance(a, numpy.ndarray):
+        return a.size
+    return len(a)
+
+def map_set_properties_array(m, transparent, walkable):
+    # sets the properties of every cell with a single copy. transparent and
+    # walkable hold width*height values in row-major order (index x+y*width),
+    # e.g. NumPy arrays of shape (height, width). clears the fov flags.
+    cmap = _map_contents(m)
+    n = cmap.width * cmap.height
+    if _map_array_size(transparent) != n or _map_array_size(walkable) != n:
+        raise TypeError('transparent and walkable must have width*height values.')
+
+    if (numpy_available and isinstance(transparent, numpy.ndarray) and
+        isinstance(walkable, numpy.ndarray)):
+        cells = (transparent.astype(numpy.bool_).ravel() * _MAP_CELL_TRANSPARENT |
+                 walkable.astype(numpy.bool_).ravel() * _MAP_CELL_WALKABLE)
+        cells = numpy.ascontiguousarray(cells, dtype=numpy.uint8)
+        memmove(cmap.cells, cells.ctypes.data, n)
+    else:
+        cells = bytearray(n)
+        for i, (t, w) in enumerate(zip(transparent, walkable)):
+            cells[i] = (t and _MAP_CELL_TRANSPARENT) | (w and _MAP_CELL_WALKABLE)
+        memmove(cmap.cells, (c_uint8 * n).from_buffer(cells), n)
+
+def _map_get_flag_array(m, flag, x, y, w, h):
+    cmap = _map_contents(m)
+    if w == 0: w = cmap.width - x
+    if h == 0: h = cmap.height - y
+    if numpy_available:
+        #read the flags straight out of libtcod's cells, without a copy
+        cells = numpy.ctypeslib.as_array(cmap.cells, shape=(cmap.height, cmap.width))
+        return cells[y:y + h, x:x + w] & flag != 0
+    cells = bytearray(string_at(cmap.cells, cmap.width * cmap.height))
+    return [cells[i + j * cmap.width] & flag != 0
+            for j in range(y, y + h) for i in range(x, x + w)]
+
+def map_get_transparent_array(m, x=0, y=0, w=0, h=0):
+    # transparency of every cell, as returned by map_set_properties_array:
+    # a (height, width) NumPy array, or a flat row-major list without NumPy.
+    # x, y, w and h pick out a rectangle instead (w or h of 0 reach the edge).
+    return _map_get_flag_array(m, _MAP_CELL_TRANSPARENT, x, y, w, h)
+
+def map_get_walkable_array(m, x=0, y=0, w=0, h=0):
+    return _map_get_flag_array(m, _MAP_CELL_WALKABLE, x, y, w, h)
+
+def map_get_fov_array(m, x=0, y=0, w=0, h=0):
+    # result of the last map_compute_fov for every cell, in one copy.
+    return _map_get_flag_array(m, _MAP_CELL_FOV, x, y, w, h)
+
 ############################
 # pathfinding module
 ############################
@@ -1,7 +1,20 @@
+import os
+import sys
 import math
+import hashlib
+import collections
+import multiprocessing
 import textwrap
 import random
-import libtcodpy as libtcod;
+import numpy
+
+# Run without a window (for benchmarks, tests and simulations) with --headless
+# or ROGUELIKE_HEADLESS=1; keys then come from the file given with --keys=FILE.
+HEADLESS = '--headless' in sys.argv or bool(os.environ.get('ROGUELIKE_HEADLESS'))
+if HEADLESS:
+    import libtcodheadless as libtcod
+else:
+    import libtcodpy as libtcod;
 
 SCREEN_WIDTH = 80;
 SCREEN_HEIGHT = 45
@@ -43,6 +56,35 @@ TILE_TYPE = {
     }
 }
 
+# The map stores tile types as small integers that index into TILE_PALETTE
+TILE_TYPE_NAMES = ['GRASS_1', 'GRASS_2', 'GRASS_3', 'FLOOR_WOOD', 'WALL_STONE']
+TILE_TYPE_INDEX = dict((name, i) for (i, name) in enumerate(TILE_TYPE_NAMES))
+TILE_PALETTE = [TILE_TYPE[name] for name in TILE_TYPE_NAMES]
+
+# The palette again as arrays, to look up a whole screen of tile types at once.
+# Tiles without a char are drawn as spaces.
+TILE_CHARS = numpy.array([ord(tile['char'] or ' ') for tile in TILE_PALETTE], dtype=numpy.int32)
+
+# How brightly a tile is drawn. Each level indexes into the color palettes
+# below, and LIGHT_BRIGHTNESS gives how far its colors are from black.
+LIGHT_UNEXPLORED = 0
+LIGHT_REMEMBERED = 1
+LIGHT_LIT = 2
+LIGHT_BRIGHTNESS = [0.0, 0.5, 1.0]
+
+def make_color_palette(color_name):
+    #an RGB table of every tile type's color at every light level, indexed
+    #[level, tile type], so the renderer never has to mix colors itself
+    palette = numpy.zeros((len(LIGHT_BRIGHTNESS), len(TILE_PALETTE), 3), dtype=numpy.uint8)
+    for (level, brightness) in enumerate(LIGHT_BRIGHTNESS):
+        for (tile_type, tile) in enumerate(TILE_PALETTE):
+            color = libtcod.color_lerp(tile[color_name], libtcod.black, 1.0 - brightness)
+            palette[level, tile_type] = (color.r, color.g, color.b)
+    return palette
+
+TILE_FOREGROUND_PALETTE = make_color_palette('foreground_color')
+TILE_BACKGROUND_PALETTE = make_color_palette('background_color')
+
 #sizes and coordinates relevant for the GUI
 BAR_WIDTH = 20
 PANEL_HEIGHT = 10
@@ -55,12 +97,9 @@ MSG_HEIGHT = PANEL_HEIGHT - 1
 ################################################################################
 # User Input
 ################################################################################
-def handle_keys():
+def handle_keys(key):
     global need_fov_refresh
 
-    # Movement keys
-    key = libtcod.console_check_for_keypress (True)
-
 
     if key.vk == libtcod.KEY_ENTER and key.lalt:
         libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
@@ -104,8 +143,8 @@ def handle_keys():
 
         # Pick up an item on the ground
         elif key.c == ord('g'):
-            for object in objects:
-                if object.x == player.x and object.y == player.y and object.item:
+            for object in object_index.at(player.x, player.y):
+                if object.item:
                     object.item.pick_up(player)
 
         # View inventory
@@ -132,6 +171,11 @@ def handle_keys():
             else:
                 message('There isn\'t anything nearby to smash')
 
+        # Look at a map of everything explored so far
+        elif key.c == ord('m'):
+            show_minimap()
+            return 'didnt-take-turn'
+
         # Wait a turn
         elif key.c == ord('.'):
             pass
@@ -169,6 +213,9 @@ class Object:
         self.color = color
         self.blocks = blocks
 
+        #what spawn() made this object from, if anything
+        self.kind = None
+
         self.fighter = fighter
         if self.fighter:  #let the fighter component know who owns it
             self.fighter.owner = self
@@ -232,6 +279,14 @@ class Object:
             y = -1
             hasMoved = self.move(x, y)
 
+    def set_blocks(self, blocks):
+        #start or stop blocking movement, keeping the map's blocking tiles current
+        if blocks and not self.blocks:
+            map.add_blocker(self.x, self.y)
+        elif self.blocks and not blocks:
+            map.remove_blocker(self.x, self.y)
+        self.blocks = blocks
+
     def distance_to(self, other):
         #return the distance to another object
         dx = other.x - self.x
@@ -241,23 +296,11 @@ class Object:
     def move(self, dx, dy):
         if not is_blocked(self.x+dx, self.y+dy):
             #move by the given amount
-            self.x += dx
-            self.y += dy
+            move_object(self, self.x + dx, self.y + dy)
             return True
         else:
             return False
  
-    def draw(self):
-        # Don't draw if outside of the player's field-of-view
-        if libtcod.map_is_in_fov(fov_map, self.x, self.y):
-            # set the color and then draw the character that represents this object at its position
-            libtcod.console_set_default_foreground(con, self.color)
-            libtcod.console_put_char(con, self.x - cam.x, self.y - cam.y, self.char, libtcod.BKGND_NONE)
- 
-    def clear(self):
-        #erase the character that represents this object
-        libtcod.console_put_char(con, self.x - cam.x, self.y - cam.y, ' ', libtcod.BKGND_NONE)
-
 class Fighter:
     #combat-related properties and methods (monster, player, NPC).
     def __init__(self, hp, defense, power, death_function=None):
@@ -296,17 +339,23 @@ class Fighter:
 class BasicMonster:
     #AI for a basic monster.
     def take_turn(self):
-        #a basic monster takes its turn. If you can see it, it can see you
+        #a basic monster takes its turn. If you can see it, it can see you, so
+        #it's only asked to when it's among visible_actors()
         monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
- 
-            #move towards player if far away
-            if monster.distance_to(player) >= 2:
+
+        #move towards player if far away: down the flow field if they're on
+        #it, straight for them if not
+        if monster.distance_to(player) >= 2:
+            if player_flow is not None and player_flow.steps_at(monster.x, monster.y) > 0:
+                step = player_flow.next_step(monster.x, monster.y)
+                if step is not None:
+                    monster.move(step[0], step[1])
+            else:
                 monster.move_towards(player.x, player.y)
- 
-            #close enough, attack! (if the player is still alive.)
-            elif player.fighter.hp > 0:
-                monster.fighter.attack(player)
+
+        #close enough, attack! (if the player is still alive.)
+        elif player.fighter.hp > 0:
+            monster.fighter.attack(player)
 
 class Item:
     def __init__(self, use_function=None, carrier=None):
@@ -324,7 +373,7 @@ class Item:
 
             # TODO: Add to carrier inventory instead of player inventory
             inventory.append(self.owner)
-            objects.remove(self.owner)
+            remove_object(self.owner)
 
             message(carrier.name + ' picked up a ' + self.owner.name + '!', libtcod.green)
     
@@ -342,26 +391,26 @@ class Door:
         x = self.owner.x
         y = self.owner.y
         self.owner.char = '+'
-        self.owner.blocks = True
-        map[x][y].block_sight = True
-        libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
+        self.owner.set_blocks(True)
+        map.set_sight(x, y, True)
+        libtcod.map_set_properties(fov_map, x, y, not map.block_sight[x, y], not map.blocked[x, y])
 
     def open(self):
         x = self.owner.x
         y = self.owner.y
         self.owner.char = '/'
-        self.owner.blocks = False
-        map[x][y].block_sight = False
-        libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
+        self.owner.set_blocks(False)
+        map.set_sight(x, y, False)
+        libtcod.map_set_properties(fov_map, x, y, not map.block_sight[x, y], not map.blocked[x, y])
 
 class Smashable:
     def smash(self, smasher=None):
         x = self.owner.x
         y = self.owner.y
         self.owner.char = '"'
-        self.owner.blocks = False
-        map[x][y].block_sight = False
-        libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
+        self.owner.set_blocks(False)
+        map.set_sight(x, y, False)
+        libtcod.map_set_properties(fov_map, x, y, not map.block_sight[x, y], not map.blocked[x, y])
         if smasher is not None:
             message(smasher.name + ' smashes the ' + self.owner.name + '.')
         else:
@@ -378,7 +427,7 @@ def player_death(player):
     player.color = libtcod.dark_red
  
     # We're on the floor now
-    send_to_back(monster)
+    send_to_back(player)
 
 def monster_death(monster):
     #transform it into a nasty corpse! it doesn't block, can't be
@@ -386,7 +435,7 @@ def monster_death(monster):
     message(monster.name.capitalize() + ' is dead!')
     monster.char = '%'
     monster.color = libtcod.dark_red
-    monster.blocks = False
+    monster.set_blocks(False)
     monster.fighter = None
     monster.ai = None
     monster.name = 'Remains of ' + monster.name
@@ -405,6 +454,52 @@ def cast_heal(target, amount=10):
         print target.fighter
         return 'cancelled'
 
+class SpatialIndex:
+    #keeps track of the objects standing on each map cell, so finding what is
+    #at a position doesn't mean scanning every object in the world.
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, object):
+        self.cells.setdefault((object.x, object.y), []).append(object)
+
+    def remove(self, object):
+        cell = self.cells[(object.x, object.y)]
+        cell.remove(object)
+        if not cell:
+            del self.cells[(object.x, object.y)]
+
+    def move(self, object, x, y):
+        #change the object's position and file it under its new cell
+        self.remove(object)
+        object.x = x
+        object.y = y
+        self.add(object)
+
+    def send_to_back(self, object):
+        cell = self.cells[(object.x, object.y)]
+        cell.remove(object)
+        cell.insert(0, object)
+
+    def at(self, x, y):
+        #the objects at (x, y), bottom-most first. it's a copy, so callers may
+        #move or remove objects while looping over it.
+        return list(self.cells.get((x, y), ()))
+
+    def in_rect(self, x1, y1, x2, y2):
+        #the objects with x1 <= x < x2 and y1 <= y < y2. walks whichever is
+        #smaller: the cells of the rectangle or the occupied cells.
+        found = []
+        if (x2 - x1) * (y2 - y1) <= len(self.cells):
+            for y in range(y1, y2):
+                for x in range(x1, x2):
+                    found.extend(self.cells.get((x, y), ()))
+        else:
+            for (x, y), cell in self.cells.items():
+                if x1 <= x < x2 and y1 <= y < y2:
+                    found.extend(cell)
+        return found
+
 ################################################################################
 # Initialize actors and items
 ################################################################################
@@ -413,11 +508,90 @@ player = Object(SCREEN_WIDTH/2, SCREEN_HEIGHT/2, '@', 'Player', libtcod.white, b
 objects = [player]
 inventory = []
 
+object_index = SpatialIndex()
+object_index.add(player)
+
+def add_object(object):
+    #put a new object into the world
+    objects.append(object)
+    object_index.add(object)
+    if object.blocks:
+        map.add_blocker(object.x, object.y)
+
+def remove_object(object):
+    #take an object out of the world (it may live on in an inventory)
+    objects.remove(object)
+    object_index.remove(object)
+    if object.blocks:
+        map.remove_blocker(object.x, object.y)
+
+def move_object(object, x, y):
+    #put an object at (x, y), keeping the spatial index and the map's
+    #blocking tiles up to date
+    if object.blocks:
+        map.remove_blocker(object.x, object.y)
+        map.add_blocker(x, y)
+    object_index.move(object, x, y)
+
 def send_to_back(object):
     #make this object be drawn first, so all others appear above it if they're in the same tile.
     global objects
     objects.remove(object)
     objects.insert(0, object)
+    object_index.send_to_back(object)
+
+def reset_objects():
+    #empty the world of everything but the player
+    global object_index
+    objects[:] = [player]
+    object_index = SpatialIndex()
+    object_index.add(player)
+
+################################################################################
+# Object kinds
+################################################################################
+# Everything a map generator puts into the world is spawned by kind, so that a
+# generated world can be saved as a list of (kind, x, y).
+def new_orc(x, y):
+    monster_fighter = Fighter(hp=10, defense=5, power=10, death_function=monster_death)
+    monster_ai = BasicMonster()
+    return Object(x, y, 'o', 'Orc', libtcod.desaturated_green, 
+        blocks=True, fighter=monster_fighter, ai=monster_ai)
+
+def new_troll(x, y):
+    monster_fighter = Fighter(hp=10, defense=5, power=10, death_function=monster_death)
+    monster_ai = BasicMonster()
+    return Object(x, y, 'T', 'Troll', libtcod.darker_green, 
+        blocks=True, fighter=monster_fighter, ai=monster_ai)
+
+def new_healing_potion(x, y):
+    item_component = Item(use_function=cast_heal)
+    return Object(x, y, '!', 'healing potion', libtcod.violet, 
+        blocks=False, item=item_component)
+
+def new_door(x, y):
+    door_component = Door()
+    return Object(x, y, '+', 'door', libtcod.dark_sepia, 
+        blocks=True, door=door_component)
+
+def new_window(x, y):
+    return Object(x, y, '#', 'window', libtcod.light_blue, 
+        blocks=True, smashable=Smashable())
+
+OBJECT_KINDS = {
+    'orc': new_orc,
+    'troll': new_troll,
+    'healing potion': new_healing_potion,
+    'door': new_door,
+    'window': new_window
+}
+
+def spawn(kind, x, y):
+    #create an object of the given kind and put it into the world
+    object = OBJECT_KINDS[kind](x, y)
+    object.kind = kind
+    add_object(object)
+    return object
 
 ################################################################################
 # Additional player set-up
@@ -431,20 +605,19 @@ def player_move_or_attack(dx, dy):
  
     #try to find an attackable object there
     target = None
-    for object in objects:
-        if object.x == x and object.y == y:
-            target = object
-
-            #attack if target found, move otherwise
-            if target is not None and target.blocks:
-                if object.fighter:
-                    player.fighter.attack(target)
-                    return
-
-                elif object.door:
-                    target.door.open()
-                    fov_recompute = True
-                    return
+    for object in object_index.at(x, y):
+        target = object
+
+        #attack if target found, move otherwise
+        if target is not None and target.blocks:
+            if object.fighter:
+                player.fighter.attack(target)
+                return
+
+            elif object.door:
+                target.door.open()
+                fov_recompute = True
+                return
                     
     player.move(dx, dy)
     fov_recompute = True
@@ -459,28 +632,101 @@ ROOM_MAX_SIZE = 20
 ROOM_MIN_SIZE = 10
 MAX_ROOMS = 450
 
+# How rooms are laid out: 'random' tries MAX_ROOMS random rectangles and keeps
+# those that fit, 'slots' cuts the map into a grid of room-sized slots and fills
+# each with probability ROOM_DENSITY
+ROOM_PLACEMENT = 'random'
+ROOM_DENSITY = 0.6
+
 MAX_ROOM_MONSTERS = 3
 MAX_ROOM_ITEMS = 3
 
-# Noise for generating terrain
-height_map = libtcod.noise_new(2)
-
 color_dark_wall = libtcod.Color(0, 0, 100)
 color_light_wall = libtcod.Color(130, 110, 50)
 color_dark_ground = libtcod.Color(50, 50, 150)
 color_light_ground = libtcod.Color(200, 180, 50)
 
-class Tile:
-    #a tile of the map and its properties
-    def __init__(self, blocked, data, block_sight = None, tile_type=None):
-        self.blocked = blocked
-        self.tile_type = tile_type
-        self.data = data
- 
+class TileMap:
+    #the tiles of the map. instead of one Tile object per cell, every property
+    #is kept in its own array, indexed as [x, y]. the tile type is a small int
+    #that indexes into TILE_PALETTE.
+    def __init__(self, width, height, blocked, tile_type):
+        self.width = width
+        self.height = height
+
+        self.blocked = numpy.empty((width, height), dtype=numpy.bool_)
+        self.blocked.fill(blocked)
+
         #by default, if a tile is blocked, it also blocks sight
+        self.block_sight = self.blocked.copy()
+        self.explored = numpy.zeros((width, height), dtype=numpy.bool_)
+
+        self.tile_type = numpy.empty((width, height), dtype=numpy.uint8)
+        self.tile_type.fill(TILE_TYPE_INDEX[tile_type])
+
+        #how many blocking objects stand on each tile, and whether the tile
+        #is blocked by anything at all (its terrain or an object). this is
+        #what is_blocked looks at; slice it to ask about a whole area.
+        self.blockers = numpy.zeros((width, height), dtype=numpy.int16)
+        self.occupied = self.blocked.copy()
+
+        #changes whenever the terrain does, so anything worked out from it
+        #(like FOV) knows when to work it out again. whoever changes the
+        #arrays directly has to call new_revision themselves.
+        self.revision = 0
+        self.revisions = 0
+
+        #(x, y, revision before, revision after) for the last set_sight, so
+        #putting a door back the way it was brings back the revision it had
+        self.last_sight_change = None
+
+    def set_tiles(self, where, blocked, block_sight=None, tile_type=None):
+        #change the terrain at "where", a position or slice like numpy.s_[x1:x2, y]
         if block_sight is None: block_sight = blocked
-        self.block_sight = block_sight
-        self.explored = False
+        self.blocked[where] = blocked
+        self.block_sight[where] = block_sight
+        if tile_type is not None:
+            self.tile_type[where] = TILE_TYPE_INDEX[tile_type]
+        self.occupied[where] = self.blocked[where] | (self.blockers[where] > 0)
+        self.new_revision()
+
+    def new_revision(self):
+        #a number this map hasn't used before, so nothing cached for an
+        #earlier revision can be mistaken for this one
+        self.revisions += 1
+        self.revision = self.revisions
+        self.last_sight_change = None
+
+    def set_sight(self, x, y, block_sight):
+        #open or close up a single tile to sight (doors, smashed furniture)
+        if self.block_sight[x, y] == block_sight:
+            return
+        self.block_sight[x, y] = block_sight
+
+        last = self.last_sight_change
+        if last is not None and last[:2] == (x, y) and last[3] == self.revision:
+            #this undoes the last change, so the map is as it was before it
+            self.revision = last[2]
+            self.last_sight_change = (x, y, last[3], last[2])
+        else:
+            before = self.revision
+            self.new_revision()
+            self.last_sight_change = (x, y, before, self.revision)
+
+    def add_blocker(self, x, y):
+        self.blockers[x, y] += 1
+        self.occupied[x, y] = True
+
+    def remove_blocker(self, x, y):
+        assert self.blockers[x, y] > 0, 'no blocker to remove at %d, %d' % (x, y)
+        self.blockers[x, y] -= 1
+        self.occupied[x, y] = self.blocked[x, y] or self.blockers[x, y] > 0
+
+    def add_blockers(self, objects):
+        #count the blocking objects that were in the world before this map was
+        for object in objects:
+            if object.blocks:
+                self.add_blocker(object.x, object.y)
 
 class Rect:
     #a rectangle on the map. used to characterize a room.
@@ -500,342 +746,513 @@ class Rect:
         return (self.x1 <= other.x2 and self.x2 >= other.x1 and
                 self.y1 <= other.y2 and self.y2 >= other.y1)
 
+class RectGrid:
+    #files rectangles under every grid cell they touch, so checking a new room
+    #for overlaps only looks at the rooms around it instead of all of them.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def cells_of(self, rect):
+        #edges count, just like in Rect.intersect
+        for x in range(rect.x1 // self.cell_size, rect.x2 // self.cell_size + 1):
+            for y in range(rect.y1 // self.cell_size, rect.y2 // self.cell_size + 1):
+                yield (x, y)
+
+    def add(self, rect):
+        for cell in self.cells_of(rect):
+            self.cells.setdefault(cell, []).append(rect)
+
+    def intersects(self, rect):
+        #returns true if the rectangle intersects with any rectangle in the grid
+        for cell in self.cells_of(rect):
+            for other in self.cells.get(cell, ()):
+                if rect.intersect(other):
+                    return True
+        return False
+
+def generate_rooms(rng=0):
+    #yields the rectangles for new rooms one at a time, none of them
+    #intersecting. the caller can carve each room before asking for the next.
+    if ROOM_PLACEMENT == 'slots':
+        for room in generate_slot_rooms(rng):
+            yield room
+        return
+
+    rooms = RectGrid(ROOM_MAX_SIZE)
+    for r in range(MAX_ROOMS):
+        #random width and height
+        w = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+        h = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+        #random position without going out of the boundaries of the map
+        x = libtcod.random_get_int(rng, 0, MAP_WIDTH - w - 1)
+        y = libtcod.random_get_int(rng, 0, MAP_HEIGHT - h - 1)
+
+        #"Rect" class makes rectangles easier to work with
+        new_room = Rect(x, y, w, h)
+
+        #only keep it if it doesn't intersect the rooms we already have
+        if not rooms.intersects(new_room):
+            rooms.add(new_room)
+            yield new_room
+
+def generate_slot_rooms(rng=0):
+    #one room at most per slot, placed somewhere inside it. slots are big
+    #enough for the largest room plus a gap, so rooms can never intersect and
+    #nothing has to be checked or thrown away.
+    slot_size = ROOM_MAX_SIZE + 2
+    for slot_y in range(MAP_HEIGHT // slot_size):
+        for slot_x in range(MAP_WIDTH // slot_size):
+            if libtcod.random_get_float(rng, 0.0, 1.0) >= ROOM_DENSITY:
+                continue
+
+            w = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+            h = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+            x = slot_x * slot_size + libtcod.random_get_int(rng, 0, slot_size - w - 1)
+            y = slot_y * slot_size + libtcod.random_get_int(rng, 0, slot_size - h - 1)
+            yield Rect(x, y, w, h)
+
 def create_room(room):
     global map
-    #go through the tiles in the rectangle and make them passable
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            map[x][y].blocked = False
-            map[x][y].block_sight = False
+    #make the tiles in the rectangle passable
+    map.set_tiles(numpy.s_[room.x1 + 1:room.x2, room.y1 + 1:room.y2], False, tile_type='FLOOR_WOOD')
 
 def create_h_tunnel(x1, x2, y):
     global map
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
+    map.set_tiles(numpy.s_[min(x1, x2):max(x1, x2) + 1, y], False, tile_type='FLOOR_WOOD')
 
 def create_v_tunnel(y1, y2, x):
     global map
     #vertical tunnel
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
+    map.set_tiles(numpy.s_[x, min(y1, y2):max(y1, y2) + 1], False, tile_type='FLOOR_WOOD')
 
-def place_objects(room):
+def place_objects(room, rng=0):
     #choose random number of monsters
-    num_monsters = libtcod.random_get_int(0, 0, MAX_ROOM_MONSTERS)
+    num_monsters = libtcod.random_get_int(rng, 0, MAX_ROOM_MONSTERS)
  
     for i in range(num_monsters):
         #choose random spot for this monster
-        x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
-        y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
+        x = libtcod.random_get_int(rng, room.x1+1, room.x2-1)
+        y = libtcod.random_get_int(rng, room.y1+1, room.y2-1)
 
         if is_blocked(x, y):
             continue
  
-        if libtcod.random_get_int(0, 0, 100) < 80:  #80% chance of getting an orc
-            #create an orc
-            monster_fighter = Fighter(hp=10, defense=5, power=10, death_function=monster_death)
-            monster_ai = BasicMonster()
-            monster = Object(x, y, 'o', 'Orc', libtcod.desaturated_green, 
-                blocks=True, fighter=monster_fighter, ai=monster_ai)
+        if libtcod.random_get_int(rng, 0, 100) < 80:  #80% chance of getting an orc
+            spawn('orc', x, y)
         else:
-            #create a troll
-            monster_fighter = Fighter(hp=10, defense=5, power=10, death_function=monster_death)
-            monster_ai = BasicMonster()
-            monster = Object(x, y, 'T', 'Troll', libtcod.darker_green, 
-                blocks=True, fighter=monster_fighter, ai=monster_ai)
- 
-        objects.append(monster)
+            spawn('troll', x, y)
 
     #choose random number of items
-    num_items = libtcod.random_get_int(0, 0, MAX_ROOM_ITEMS)
+    num_items = libtcod.random_get_int(rng, 0, MAX_ROOM_ITEMS)
  
     for i in range(num_items):
         #choose random spot for this item
-        x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
-        y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
+        x = libtcod.random_get_int(rng, room.x1+1, room.x2-1)
+        y = libtcod.random_get_int(rng, room.y1+1, room.y2-1)
  
         #only place it if the tile is not blocked
         if not is_blocked(x, y):
-            #create a healing potion
-            item_component = Item(use_function=cast_heal)
-            item = Object(x, y, '!', 'healing potion', libtcod.violet, 
-                blocks=False, item=item_component)
- 
-            objects.append(item)
+            item = spawn('healing potion', x, y)
             send_to_back(item)  #items appear below other objects
 
-def make_debug_map():
+def make_debug_map(seed=None):
     global map
  
     # Fill map with "unblocked" tiles
-    map = [[ Tile(False)
-        for y in range(MAP_HEIGHT) ]
-            for x in range(MAP_WIDTH) ]
+    map = TileMap(MAP_WIDTH, MAP_HEIGHT, False, 'GRASS_3')
+    map.add_blockers(objects)
 
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            if y == 0 or y == MAP_HEIGHT-1 or x == 0 or x == MAP_WIDTH-1:
-                map[x][y].blocked = True
+    for edge in (numpy.s_[0, :], numpy.s_[MAP_WIDTH-1, :], numpy.s_[:, 0], numpy.s_[:, MAP_HEIGHT-1]):
+        map.set_tiles(edge, True, block_sight=False)
 
-    player.x = 20
-    player.y = 20
+    move_object(player, 20, 20)
 
-def make_map():
+def make_map(seed):
     global map
+    rng = libtcod.random_new_from_seed(seed)
  
-    # Fill map with "unblocked" tiles
-    map = [[ Tile(True)
-        for y in range(MAP_HEIGHT) ]
-            for x in range(MAP_WIDTH) ]
+    # Fill map with "blocked" tiles
+    map = TileMap(MAP_WIDTH, MAP_HEIGHT, True, 'WALL_STONE')
+    map.add_blockers(objects)
 
     rooms = []
     num_rooms = 0
 
-    for r in range(MAX_ROOMS):
-        #random width and height
-        w = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-        h = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-        #random position without going out of the boundaries of the map
-        x = libtcod.random_get_int(0, 0, MAP_WIDTH - w - 1)
-        y = libtcod.random_get_int(0, 0, MAP_HEIGHT - h - 1)
-
-        #"Rect" class makes rectangles easier to work with
-        new_room = Rect(x, y, w, h)
+    for new_room in generate_rooms(rng):
+        #"paint" it to the map's tiles
+        create_room(new_room)
  
-        #run through the other rooms and see if they intersect with this one
-        failed = False
-        for other_room in rooms:
-            if new_room.intersect(other_room):
-                failed = True
-                break
-
-        if not failed:
-            #this means there are no intersections, so this room is valid
+        #center coordinates of new room, will be useful later
+        (new_x, new_y) = new_room.center()
  
-            #"paint" it to the map's tiles
-            create_room(new_room)
+        if num_rooms == 0:
+            #this is the first room, where the player starts at
+            move_object(player, new_x, new_y)
+            
+        else:
+            #all rooms after the first:
+            #connect it to the previous room with a tunnel
  
-            #center coordinates of new room, will be useful later
-            (new_x, new_y) = new_room.center()
+            #center coordinates of previous room
+            (prev_x, prev_y) = rooms[num_rooms-1].center()
  
-            if num_rooms == 0:
-                #this is the first room, where the player starts at
-                player.x = new_x
-                player.y = new_y
-                
+            #draw a coin (random number that is either 0 or 1)
+            if libtcod.random_get_int(rng, 0, 1) == 1:
+                #first move horizontally, then vertically
+                create_h_tunnel(prev_x, new_x, prev_y)
+                create_v_tunnel(prev_y, new_y, new_x)
             else:
-                #all rooms after the first:
-                #connect it to the previous room with a tunnel
- 
-                #center coordinates of previous room
-                (prev_x, prev_y) = rooms[num_rooms-1].center()
- 
-                #draw a coin (random number that is either 0 or 1)
-                if libtcod.random_get_int(0, 0, 1) == 1:
-                    #first move horizontally, then vertically
-                    create_h_tunnel(prev_x, new_x, prev_y)
-                    create_v_tunnel(prev_y, new_y, new_x)
-                else:
-                    #first move vertically, then horizontally
-                    create_v_tunnel(prev_y, new_y, prev_x)
-                    create_h_tunnel(prev_x, new_x, new_y)
-
-            # Add some objects to the room
-            place_objects(new_room)
+                #first move vertically, then horizontally
+                create_v_tunnel(prev_y, new_y, prev_x)
+                create_h_tunnel(prev_x, new_x, new_y)
+
+        # Add some objects to the room
+        place_objects(new_room, rng)
  
-            #finally, append the new room to the list
-            rooms.append(new_room)
-            num_rooms += 1
+        #finally, append the new room to the list
+        rooms.append(new_room)
+        num_rooms += 1
+
+        # optional: print "room number" to see how the map drawing worked
+        # we may have more than ten rooms, so print 'A' for the first room, 'B' for the next...
+        # room_no = Object(new_x, new_y, chr(65+num_rooms), libtcod.white)
+        # objects.insert(0, room_no) #draw early, so monsters are drawn on top
 
-            # optional: print "room number" to see how the map drawing worked
-            # we may have more than ten rooms, so print 'A' for the first room, 'B' for the next...
-            # room_no = Object(new_x, new_y, chr(65+num_rooms), libtcod.white)
-            # objects.insert(0, room_no) #draw early, so monsters are drawn on top
+    libtcod.random_delete(rng)
 
-def create_building(room):
+def create_building(room, rng=0):
     global map
+    #floor the whole rectangle, then turn its outline into impassable walls
+    map.tile_type[room.x1:room.x2, room.y1:room.y2] = TILE_TYPE_INDEX['FLOOR_WOOD']
+    for outline in (numpy.s_[room.x1, room.y1:room.y2], numpy.s_[room.x2-1, room.y1:room.y2],
+                    numpy.s_[room.x1:room.x2, room.y1], numpy.s_[room.x1:room.x2, room.y2-1]):
+        map.set_tiles(outline, True, tile_type='WALL_STONE')
+
+    #collect the wall tiles that may become doors or windows
     walls = []
-    #go through the tiles in the rectangle and make them impassable
     for x in range(room.x1, room.x2):
-        for y in range(room.y1, room.y2):
-            map[x][y].data = TILE_TYPE['FLOOR_WOOD']
-            
-            if x == room.x1 or y == room.y1 or x == room.x2-1 or y == room.y2-1:
-                map[x][y].blocked = True
-                map[x][y].block_sight = True
-                map[x][y].data = TILE_TYPE['WALL_STONE']
+        if x == room.x1 or x == room.x2-1: outline_ys = range(room.y1, room.y2)
+        else: outline_ys = (room.y1, room.y2-1)
 
-                if (x == room.x1 and y == room.y1) or (x == room.x2-1 and y == room.y1) or (x == room.x2-1 and y == room.y2-1) or (x == room.x1 and room.y2-1):
-                    pass
-                else:
-                    walls.append((x, y))
+        for y in outline_ys:
+            if (x == room.x1 and y == room.y1) or (x == room.x2-1 and y == room.y1) or (x == room.x2-1 and y == room.y2-1) or (x == room.x1 and room.y2-1):
+                pass
+            else:
+                walls.append((x, y))
 
     # Make doors
     num_doors = 2
     doors = []
     while len(doors) < num_doors:
-        selected = walls[libtcod.random_get_int(0, 0, len(walls)-1)]
+        selected = walls[libtcod.random_get_int(rng, 0, len(walls)-1)]
         if not selected in doors:
             x, y = selected
-            map[x][y].block_sight = True
-            map[x][y].blocked = False
-            map[x][y].data = TILE_TYPE['FLOOR_WOOD']
-            
-            door_component = Door()
-            new_door = Object(x, y, '+', 'door', libtcod.dark_sepia, 
-                blocks=True, door=door_component)
-            objects.append(new_door)
+            map.set_tiles((x, y), False, block_sight=True, tile_type='FLOOR_WOOD')
+            spawn('door', x, y)
             doors.append(selected)
 
     # Make windows
     num_windows = 2
     windows = []
     while len(windows) < num_windows:
-        selected = walls[libtcod.random_get_int(0, 0, len(walls)-1)]
+        selected = walls[libtcod.random_get_int(rng, 0, len(walls)-1)]
         if not selected in doors and not selected in windows:
             x, y = selected
-            map[x][y].block_sight = False
-            map[x][y].blocked = False
-            map[x][y].data = TILE_TYPE['FLOOR_WOOD']
-
-            new_window = Object(x, y, '#', 'window', libtcod.light_blue, 
-                blocks=True, smashable=Smashable())
-            objects.append(new_window)
+            map.set_tiles((x, y), False, tile_type='FLOOR_WOOD')
+            spawn('window', x, y)
             windows.append(selected)
 
-def make_outdoor_map():
+def classify_terrain(samples):
+    #turn an array of noise samples into an array of grass tile types
+    tile_types = numpy.empty(samples.shape, dtype=numpy.uint8)
+    tile_types.fill(TILE_TYPE_INDEX['GRASS_2'])
+    tile_types[samples > 0.2] = TILE_TYPE_INDEX['GRASS_1']
+    tile_types[samples < -0.2] = TILE_TYPE_INDEX['GRASS_3']
+    return tile_types
+
+def make_terrain(seed, x0, y0, width, height):
+    #grass tile types for the area whose top-left corner is at (x0, y0). the
+    #noise only depends on the seed and the world position, so areas that are
+    #made separately line up with each other.
+    noise_rng = libtcod.random_new_from_seed(seed)
+    height_map = libtcod.noise_new(2, random=noise_rng)
+
+    # Sample the whole area at once ([y, x], so transpose it)
+    samples = libtcod.noise_get_array(height_map, width, height, 0.1, 0.1, x0, y0,
+        typ=libtcod.NOISE_PERLIN).T
+
+    libtcod.noise_delete(height_map)
+    libtcod.random_delete(noise_rng)
+    return classify_terrain(samples)
+
+def make_outdoor_map(seed):
     global map
  
     # Fill map with "unblocked" tiles
-    data = libtcod.noise_get(height_map, [10, 10])
-    map = [[ Tile(False, data=TILE_TYPE['GRASS_3'])
-        for y in range(MAP_HEIGHT) ]
-            for x in range(MAP_WIDTH) ]
-
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            data = libtcod.noise_get(height_map, [x*0.1, y*0.1], libtcod.NOISE_PERLIN)
-            # print data
-            if data > 0.2:  data = TILE_TYPE['GRASS_1']
-            elif data < -0.2: data = TILE_TYPE['GRASS_3']
-            else: data = TILE_TYPE['GRASS_2']
-            map[y][x].data = data
+    map = TileMap(MAP_WIDTH, MAP_HEIGHT, False, 'GRASS_3')
+    map.add_blockers(objects)
+    map.tile_type[:] = make_terrain(seed, 0, 0, MAP_WIDTH, MAP_HEIGHT)
 
+    place_buildings(seed)
+
+def place_buildings(seed):
+    rng = libtcod.random_new_from_seed(seed)
     buildings = []
     num_buildings = 0
 
-    for r in range(MAX_ROOMS):
-        #random width and height
-        w = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-        h = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-        #random position without going out of the boundaries of the map
-        x = libtcod.random_get_int(0, 0, MAP_WIDTH - w - 1)
-        y = libtcod.random_get_int(0, 0, MAP_HEIGHT - h - 1)
-
-        #"Rect" class makes rectangles easier to work with
-        new_room = Rect(x, y, w, h)
- 
-        #run through the other buildings and see if they intersect with this one
-        failed = False
-        for other_room in buildings:
-            if new_room.intersect(other_room):
-                failed = True
-                break
-
-        if not failed:
-            #this means there are no intersections, so this room is valid
- 
-            #"paint" it to the map's tiles
-            create_building(new_room)
+    for new_room in generate_rooms(rng):
+        #"paint" it to the map's tiles
+        create_building(new_room, rng)
  
-            #center coordinates of new room, will be useful later
-            (new_x, new_y) = new_room.center()
+        #center coordinates of new room, will be useful later
+        (new_x, new_y) = new_room.center()
  
-            if num_buildings == 0:
-                #this is the first room, where the player starts at
-                player.x = new_x
-                player.y = new_y
+        if num_buildings == 0:
+            #this is the first room, where the player starts at
+            move_object(player, new_x, new_y)
 
-            # Add some objects to the room
-            place_objects(new_room)
+        # Add some objects to the room
+        place_objects(new_room, rng)
  
-            #finally, append the new room to the list
-            buildings.append(new_room)
-            num_buildings += 1
+        #finally, append the new room to the list
+        buildings.append(new_room)
+        num_buildings += 1
 
-            # optional: print "room number" to see how the map drawing worked
-            # we may have more than ten rooms, so print 'A' for the first room, 'B' for the next...
-            # room_no = Object(new_x, new_y, chr(65+num_rooms), libtcod.white)
-            # objects.insert(0, room_no) #draw early, so monsters are drawn on top
+        # optional: print "room number" to see how the map drawing worked
+        # we may have more than ten rooms, so print 'A' for the first room, 'B' for the next...
+        # room_no = Object(new_x, new_y, chr(65+num_rooms), libtcod.white)
+        # objects.insert(0, room_no) #draw early, so monsters are drawn on top
+
+    libtcod.random_delete(rng)
 
 def is_blocked(x, y):
-    #first test the map tile
-    if map[x][y].blocked:
-        return True
- 
-    #now check for any blocking objects
-    for object in objects:
-        if object.blocks and object.x == x and object.y == y:
-            return True
- 
-    return False      
+    #the map keeps track of blocking tiles and blocking objects together
+    return map.occupied[x, y]
+
+# Above this many changed cells, a layer is redrawn with console_fill_* instead
+# of one call per cell
+MAX_CELL_UPDATES = VIEWPORT_WIDTH * VIEWPORT_HEIGHT / 16
+
+# Cells with this background are left out when a layer is blitted, so what's
+# under them shows through. No tile or light level may use it.
+LAYER_KEY_COLOR = libtcod.Color(255, 0, 255)
+
+class Layer:
+    #an off-screen console the size of the viewport, with arrays ([y, x] like
+    #the console) of what is on it, so that update() only rewrites the cells
+    #that differ. "changed" says whether anything was written since the last
+    #time the layer was composited.
+    def __init__(self, width, height, key_color=None):
+        self.width = width
+        self.height = height
+        self.console = libtcod.console_new(width, height)
+        if key_color is not None:
+            libtcod.console_set_key_color(self.console, key_color)
+
+        #a second console to scroll into (see scroll)
+        self.spare = None
+
+        self.chars = numpy.zeros((height, width), dtype=numpy.int32)
+        self.foreground = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+        self.background = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+        self.changed = True
+
+    def scroll(self, dx, dy):
+        #the camera moved by (dx, dy): shift what's drawn the other way, so
+        #that only the strips it uncovers are left to draw. only for layers
+        #without a key color, as blitting skips key-colored cells.
+        if self.spare is None:
+            self.spare = libtcod.console_new(self.width, self.height)
+        w = self.width - abs(dx)
+        h = self.height - abs(dy)
+        (src_x, dst_x) = (max(dx, 0), max(-dx, 0))
+        (src_y, dst_y) = (max(dy, 0), max(-dy, 0))
+
+        #blit into the spare console and swap them, as a console can't be
+        #blitted onto itself
+        libtcod.console_blit(self.console, src_x, src_y, w, h, self.spare, dst_x, dst_y)
+        (self.console, self.spare) = (self.spare, self.console)
+        self.changed = True
+
+        #the uncovered cells hold stale contents: mark them with a char that
+        #never matches, so they get drawn
+        for (name, blank) in (('chars', -1), ('foreground', 0), ('background', 0)):
+            old = getattr(self, name)
+            shifted = numpy.empty_like(old)
+            shifted.fill(blank)
+            shifted[dst_y:dst_y + h, dst_x:dst_x + w] = old[src_y:src_y + h, src_x:src_x + w]
+            setattr(self, name, shifted)
+
+    def update(self, chars, foreground, background):
+        #make the console show these chars and colors
+        changed = ((chars != self.chars) | (foreground != self.foreground).any(axis=2) |
+                   (background != self.background).any(axis=2))
+        (ys, xs) = numpy.nonzero(changed)
+
+        if len(ys) > MAX_CELL_UPDATES:
+            #so much changed that filling the whole console is cheaper
+            libtcod.console_fill_char(self.console, chars.ravel())
+            libtcod.console_fill_foreground(self.console, foreground[..., 0].ravel(),
+                foreground[..., 1].ravel(), foreground[..., 2].ravel())
+            libtcod.console_fill_background(self.console, background[..., 0].ravel(),
+                background[..., 1].ravel(), background[..., 2].ravel())
+        else:
+            for (x, y) in zip(xs.tolist(), ys.tolist()):
+                libtcod.console_put_char_ex(self.console, x, y, int(chars[y, x]),
+                    libtcod.Color(*foreground[y, x].tolist()), libtcod.Color(*background[y, x].tolist()))
+
+        if len(ys):
+            self.changed = True
+        self.chars = chars
+        self.foreground = foreground
+        self.background = background
+
+class Viewport:
+    #the map part of the screen, drawn in layers that each change at their
+    #own rate and are composited onto con with console_blit:
+    #  terrain   every tile in full light. redrawn when the camera moves,
+    #            mostly by scrolling.
+    #  lighting  the tiles that aren't in full light, at their light level;
+    #            lit tiles have the key color and let the terrain through.
+    #            redrawn when the FOV is recomputed or the camera moves.
+    #  entities  the objects in view, blitted without their background so
+    #            the tile's shows. redrawn when they change.
+    #con is only composited again when one of the layers changed.
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.terrain = Layer(width, height)
+        self.lighting = Layer(width, height, LAYER_KEY_COLOR)
+        self.entities = Layer(width, height, LAYER_KEY_COLOR)
+
+        #the map and camera position the layers were last drawn for, and
+        #what the player sees of the viewport
+        self.drawn_at = None
+        self.visible = None
+
+    def view(self):
+        #the viewport's part of the [x, y] map arrays
+        return numpy.s_[cam.x:cam.x + self.width, cam.y:cam.y + self.height]
+
+    def update_terrain(self):
+        tiles = map.tile_type[self.view()].T
+        self.terrain.update(TILE_CHARS[tiles], TILE_FOREGROUND_PALETTE[LIGHT_LIT, tiles],
+            TILE_BACKGROUND_PALETTE[LIGHT_LIT, tiles])
+
+    def update_lighting(self):
+        #the FOV is [y, x] like the layers, the map arrays are [x, y]
+        visible = fov.visible_in(cam.x, cam.y, self.width, self.height)
+        newly_explored = visible.T & ~map.explored[self.view()]
+        if newly_explored.any():
+            map.explored[self.view()] |= newly_explored
+            minimap.reveal_mask(cam.x, cam.y, newly_explored)
+        explored = map.explored[self.view()].T
+        tiles = map.tile_type[self.view()].T
+
+        #if it's not visible right now, the player can only see it if it's
+        #explored, and then only dimly
+        light = numpy.where(visible, LIGHT_LIT,
+            numpy.where(explored, LIGHT_REMEMBERED, LIGHT_UNEXPLORED))
+
+        chars = TILE_CHARS[tiles]
+        foreground = TILE_FOREGROUND_PALETTE[light, tiles]
+        background = TILE_BACKGROUND_PALETTE[light, tiles]
+
+        #let the terrain show through wherever it is lit
+        chars[visible] = ord(' ')
+        foreground[visible] = 0
+        background[visible] = (LAYER_KEY_COLOR.r, LAYER_KEY_COLOR.g, LAYER_KEY_COLOR.b)
+
+        self.lighting.update(chars, foreground, background)
+        self.visible = visible
+
+    def update_entities(self, objects):
+        chars = numpy.empty((self.height, self.width), dtype=numpy.int32)
+        chars.fill(ord(' '))
+        foreground = numpy.zeros((self.height, self.width, 3), dtype=numpy.uint8)
+        background = numpy.empty((self.height, self.width, 3), dtype=numpy.uint8)
+        background[:] = (LAYER_KEY_COLOR.r, LAYER_KEY_COLOR.g, LAYER_KEY_COLOR.b)
+
+        #the last object drawn at a cell is the one that shows
+        for object in objects:
+            x = object.x - cam.x
+            y = object.y - cam.y
+            if 0 <= x < self.width and 0 <= y < self.height and self.visible[y, x]:
+                chars[y, x] = ord(object.char)
+                foreground[y, x] = (object.color.r, object.color.g, object.color.b)
+                background[y, x] = 0
+
+        self.entities.update(chars, foreground, background)
+
+    def follow_camera(self):
+        #scroll the terrain if the camera moved by less than the viewport
+        #over the same map
+        if self.drawn_at is None or self.drawn_at[0] is not map:
+            return
+        dx = cam.x - self.drawn_at[1]
+        dy = cam.y - self.drawn_at[2]
+        if abs(dx) < self.width and abs(dy) < self.height:
+            self.terrain.scroll(dx, dy)
+
+    def draw(self, objects, fov_changed):
+        #bring each layer up to date, then composite them if anything changed
+        moved = self.drawn_at != (map, cam.x, cam.y)
+        if moved:
+            self.follow_camera()
+            self.update_terrain()
+        if moved or fov_changed:
+            self.update_lighting()
+        self.update_entities(objects)
+        self.drawn_at = (map, cam.x, cam.y)
+
+        layers = (self.terrain, self.lighting, self.entities)
+        if not any(layer.changed for layer in layers):
+            return
+        libtcod.console_blit(self.terrain.console, 0, 0, self.width, self.height, con, 0, 0)
+        libtcod.console_blit(self.lighting.console, 0, 0, self.width, self.height, con, 0, 0)
+        libtcod.console_blit(self.entities.console, 0, 0, self.width, self.height, con, 0, 0, 1.0, 0.0)
+        for layer in layers:
+            layer.changed = False
 
 def render_all():
-    global fov_map, color_dark_wall, color_light_wall
-    global color_dark_ground, color_light_ground
-    global need_fov_refresh
-
+    global need_fov_refresh, fov
 
+    fov_changed = need_fov_refresh
     if need_fov_refresh:
 
         #recompute FOV if needed (the player moved or something)
         need_fov_refresh = False
-        libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
- 
-        #go through all tiles, and set their background color according to the FOV
-        for y in range(VIEWPORT_HEIGHT):
-            for x in range(VIEWPORT_WIDTH):
-
-                map_x = cam.x + x
-                map_y = cam.y + y
-
-                visible = libtcod.map_is_in_fov(fov_map, map_x, map_y)
-                wall = map[map_x][map_y].block_sight
-
-                foreground_color = map[map_x][map_y].data['foreground_color']
-                background_color = map[map_x][map_y].data['background_color']
-                tile_char = map[map_x][map_y].data['char']
-                
-                if not visible:
-                    #if it's not visible right now, the player can only see it if it's explored
-                    if map[map_x][map_y].explored:
-                        foreground_color = libtcod.color_lerp(foreground_color, libtcod.black, 0.5)
-                        background_color = libtcod.color_lerp(background_color, libtcod.black, 0.5)
-                    else:
-                        foreground_color = libtcod.black;
-                        background_color = libtcod.black;
-
-                else:
-                    #it's visible
-
-                    #since it's visible, explore it
-                    map[map_x][map_y].explored = True
-
-                if len(tile_char) > 0: libtcod.console_put_char(con, x, y, tile_char)
-                libtcod.console_set_char_foreground(con, x, y, foreground_color )
-                libtcod.console_set_char_background(con, x, y, background_color )
- 
-    #draw all objects in the list
-    for object in objects:
-        if object != player:
-            object.draw()
-    player.draw()
+        fov = compute_fov(player.x, player.y, TORCH_RADIUS, PLAYER_FOV_ENGINE)
+
+    #draw the objects on screen: the spatial index lists each cell's objects
+    #bottom-most first, and the player goes on top of everything
+    on_screen = object_index.in_rect(cam.x, cam.y, cam.x + VIEWPORT_WIDTH, cam.y + VIEWPORT_HEIGHT)
+    viewport.draw([object for object in on_screen if object != player] + [player], fov_changed)
      
     #blit the contents of "con" to the root console
     libtcod.console_blit(con, 0, 0, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, 0, 0, 0)
 
+    #the GUI panel is the top layer
+    render_panel()
+
+    #blit the contents of "panel" to the root console
+    libtcod.console_blit(panel, 0, 0, VIEWPORT_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
+
+# What the GUI panel was last drawn with. It's only drawn again when that
+# changes, and otherwise just blitted as it is.
+panel_drawn_for = None
+
+def render_panel():
+    global panel_drawn_for
+
+    drawn_for = (player.fighter.hp, player.fighter.max_hp,
+        [(line, (color.r, color.g, color.b)) for (line, color) in game_msgs])
+    if drawn_for == panel_drawn_for:
+        return
+    panel_drawn_for = drawn_for
+
     #prepare to render the GUI panel
     libtcod.console_set_default_background(panel, libtcod.black)
     libtcod.console_clear(panel)
@@ -850,9 +1267,6 @@ def render_all():
         libtcod.console_set_default_foreground(panel, color)
         libtcod.console_print_ex(panel, MSG_X, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
         y += 1
- 
-    #blit the contents of "panel" to the root console
-    libtcod.console_blit(panel, 0, 0, VIEWPORT_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
 
 def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
     #render a bar (HP, experience, etc). first calculate the width of the bar
@@ -896,11 +1310,210 @@ def get_first_adjacent(target, component_name):
     ]
     for tile in adjacent_tiles:
         x, y = tile
-        for object in objects:
-            if object.x == x and object.y == y and hasattr(target, component_name) and getattr(object, component_name) != None:
+        for object in object_index.at(x, y):
+            if hasattr(target, component_name) and getattr(object, component_name) != None:
                 return object
     return None
 
+################################################################################
+# World generation and caching
+################################################################################
+MAP_GENERATORS = {
+    'dungeon': make_map,
+    'outdoor': make_outdoor_map,
+    'debug': make_debug_map
+}
+
+# Finished worlds are saved here, so the same seed and settings load instead of
+# being generated again. Only worlds asked for by seed are saved: one with a
+# random seed would never be asked for again. Set to None to always generate.
+WORLD_CACHE_DIR = 'world_cache'
+WORLD_CACHE_VERSION = 1
+
+def world_parameters():
+    #everything besides the seed that changes what a generator makes
+    return {
+        'MAP_WIDTH': MAP_WIDTH,
+        'MAP_HEIGHT': MAP_HEIGHT,
+        'ROOM_MIN_SIZE': ROOM_MIN_SIZE,
+        'ROOM_MAX_SIZE': ROOM_MAX_SIZE,
+        'MAX_ROOMS': MAX_ROOMS,
+        'MAX_ROOM_MONSTERS': MAX_ROOM_MONSTERS,
+        'MAX_ROOM_ITEMS': MAX_ROOM_ITEMS,
+        'ROOM_PLACEMENT': ROOM_PLACEMENT,
+        'ROOM_DENSITY': ROOM_DENSITY,
+        'GENERATION_CHUNK_SIZE': GENERATION_CHUNK_SIZE,
+        'WORLD_CACHE_VERSION': WORLD_CACHE_VERSION
+    }
+
+def world_cache_path(generator, seed):
+    key = repr((generator, seed, sorted(world_parameters().items())))
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(WORLD_CACHE_DIR, '%s-%d-%s.npz' % (generator, seed, digest))
+
+def save_world(path):
+    #write the map and everything the generator spawned, in drawing order
+    spawned = [object for object in objects if object.kind is not None]
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    #write to a temporary file first, so a half-written world is never loaded
+    with open(path + '.tmp', 'wb') as f:
+        numpy.savez_compressed(f,
+            blocked=map.blocked, block_sight=map.block_sight, tile_type=map.tile_type,
+            object_kinds=numpy.array([object.kind for object in spawned], dtype=numpy.str_),
+            object_xs=numpy.array([object.x for object in spawned], dtype=numpy.int32),
+            object_ys=numpy.array([object.y for object in spawned], dtype=numpy.int32),
+            player=numpy.array([player.x, player.y], dtype=numpy.int32))
+    os.rename(path + '.tmp', path)
+
+def read_world(path):
+    global map
+    with numpy.load(path) as saved:
+        map = TileMap(MAP_WIDTH, MAP_HEIGHT, False, 'GRASS_3')
+        map.set_tiles(numpy.s_[:, :], saved['blocked'], saved['block_sight'])
+        map.tile_type[:] = saved['tile_type']
+        map.add_blockers(objects)
+
+        for kind, x, y in zip(saved['object_kinds'], saved['object_xs'], saved['object_ys']):
+            spawn(str(kind), int(x), int(y))
+        move_object(player, int(saved['player'][0]), int(saved['player'][1]))
+
+def load_world(generator, seed=None):
+    #make a fresh world with one of the MAP_GENERATORS, or load it from the
+    #cache if this seed and these settings were generated before. returns the
+    #seed, which is picked at random if not given.
+    reset_objects()
+    if seed is None:
+        seed = libtcod.random_get_int(0, 0, 0x7FFFFFFF)
+        generate_world(generator, seed)
+        return seed
+
+    if WORLD_CACHE_DIR is None:
+        generate_world(generator, seed)
+        return seed
+
+    path = world_cache_path(generator, seed)
+    if os.path.exists(path):
+        read_world(path)
+    else:
+        generate_world(generator, seed)
+        save_world(path)
+    return seed
+
+################################################################################
+# Parallel chunked generation
+################################################################################
+# With GENERATION_CHUNK_SIZE set, 'outdoor' and 'dungeon' worlds are cut into
+# chunks of about that many tiles square, and each chunk is generated in its
+# own worker process. Terrain noise is sampled at world positions, so it runs
+# smoothly across chunk edges; rooms and buildings always stay inside their
+# chunk. Chunk seeds come from the world seed and the chunk's place, so the
+# result doesn't depend on the number of processes.
+GENERATION_CHUNK_SIZE = None
+GENERATION_PROCESSES = None  # None uses every core
+
+def chunk_edges(length):
+    #split 0..length into chunks of at least GENERATION_CHUNK_SIZE tiles
+    num_chunks = max(1, length // GENERATION_CHUNK_SIZE)
+    return [(i * length // num_chunks, (i + 1) * length // num_chunks) for i in range(num_chunks)]
+
+def generate_chunk(job):
+    #runs in a worker process: generate the chunk as if it were a whole (small)
+    #world, then describe it the way save_world does. the world's size and room
+    #count come with the job, and the globals the generators read are put back
+    #afterwards, since a worker goes on to run other chunks.
+    global MAP_WIDTH, MAP_HEIGHT, MAX_ROOMS
+    saved = (MAP_WIDTH, MAP_HEIGHT, MAX_ROOMS)
+    try:
+        return generate_chunk_now(job)
+    finally:
+        (MAP_WIDTH, MAP_HEIGHT, MAX_ROOMS) = saved
+
+def generate_chunk_now(job):
+    global MAP_WIDTH, MAP_HEIGHT, MAX_ROOMS, map
+    (generator, seed, chunk_seed, x0, y0, width, height,
+        world_width, world_height, world_max_rooms) = job
+
+    MAX_ROOMS = max(1, world_max_rooms * width * height // (world_width * world_height))
+    MAP_WIDTH = width
+    MAP_HEIGHT = height
+    reset_objects()
+    object_index.move(player, 0, 0)
+
+    if generator == 'outdoor':
+        map = TileMap(width, height, False, 'GRASS_3')
+        map.add_blockers(objects)
+        map.tile_type[:] = make_terrain(seed, x0, y0, width, height)
+        place_buildings(chunk_seed)
+    else:
+        make_map(chunk_seed)
+
+    spawned = [(object.kind, object.x, object.y) for object in objects if object.kind is not None]
+
+    #no room is ever centered on (0, 0), so the player staying there means
+    #the chunk has no rooms at all
+    start = None
+    if (player.x, player.y) != (0, 0):
+        start = (player.x, player.y)
+    return (map.blocked, map.block_sight, map.tile_type, spawned, start)
+
+def make_chunked_map(generator, seed):
+    global map
+    jobs = []
+    for (y0, y1) in chunk_edges(MAP_HEIGHT):
+        for (x0, x1) in chunk_edges(MAP_WIDTH):
+            chunk_seed = (seed * 1000003 + y0 * 10007 + x0) & 0x7FFFFFFF
+            jobs.append((generator, seed, chunk_seed, x0, y0, x1 - x0, y1 - y0,
+                         MAP_WIDTH, MAP_HEIGHT, MAX_ROOMS))
+
+    pool = multiprocessing.Pool(GENERATION_PROCESSES)
+    try:
+        chunks = pool.map(generate_chunk, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    #stitch the chunks together, in a fixed order. the player may still be
+    #wherever the last world left them, so park them at (0, 0) for now.
+    object_index.move(player, 0, 0)
+    map = TileMap(MAP_WIDTH, MAP_HEIGHT, False, 'GRASS_3')
+    map.add_blockers(objects)
+    starts = []
+    for job, (blocked, block_sight, tile_type, spawned, start) in zip(jobs, chunks):
+        x0, y0, width, height = job[3:7]
+        area = numpy.s_[x0:x0 + width, y0:y0 + height]
+        map.set_tiles(area, blocked, block_sight)
+        map.tile_type[area] = tile_type
+
+        for (kind, x, y) in spawned:
+            spawn(kind, x0 + x, y0 + y)
+        if start is not None:
+            starts.append((x0 + start[0], y0 + start[1]))
+
+    #the player starts where the first chunk with rooms would have put them.
+    #with no rooms anywhere, on the first free tile there is.
+    if starts:
+        move_object(player, starts[0][0], starts[0][1])
+    else:
+        free = numpy.argwhere(~map.occupied)
+        if len(free) == 0:
+            raise ValueError('no room for the player in the generated world')
+        move_object(player, int(free[0][0]), int(free[0][1]))
+
+    if generator == 'dungeon':
+        #each chunk is a connected dungeon of its own; join them up in the
+        #same order, like make_map joins its rooms
+        for (prev_x, prev_y), (new_x, new_y) in zip(starts, starts[1:]):
+            create_h_tunnel(prev_x, new_x, prev_y)
+            create_v_tunnel(prev_y, new_y, new_x)
+
+def generate_world(generator, seed):
+    if GENERATION_CHUNK_SIZE and generator in ('outdoor', 'dungeon'):
+        make_chunked_map(generator, seed)
+    else:
+        MAP_GENERATORS[generator](seed)
+
 ################################################################################
 # Game Messages
 ################################################################################
@@ -921,6 +1534,12 @@ def message(new_msg, color = libtcod.white):
 ################################################################################
 # Menus
 ################################################################################
+# Off-screen consoles for menu windows, one per size, each with the header and
+# options last drawn on it. They're reused rather than made anew (and never
+# deleted) every time a menu opens, and the same menu opening again is just
+# blitted as it is.
+menu_windows = {}
+
 def show_menu(header, options, width):
     if len(options) > 26: raise ValueError('Menu cannot not have more than 26 items.')
     
@@ -928,21 +1547,27 @@ def show_menu(header, options, width):
     header_height = libtcod.console_get_height_rect(con, 0, 0, width, SCREEN_HEIGHT, header)
     height = len(options) + header_height
 
-    #create an off-screen console that represents the menu's window
-    window = libtcod.console_new(width, height)
+    #get the off-screen console that represents the menu's window
+    if (width, height) not in menu_windows:
+        menu_windows[(width, height)] = [libtcod.console_new(width, height), None]
+    (window, drawn_for) = menu_windows[(width, height)]
+
+    if drawn_for != (header, options):
+        menu_windows[(width, height)][1] = (header, list(options))
+        libtcod.console_clear(window)
  
-    #print the header, with auto-wrap
-    libtcod.console_set_default_foreground(window, libtcod.white)
-    libtcod.console_print_rect_ex(window, 0, 0, width, height, libtcod.BKGND_NONE, libtcod.LEFT, header)
-
-    #print all the options
-    y = header_height
-    letter_index = ord('a')
-    for option_text in options:
-        text = '(' + chr(letter_index) + ') ' + option_text
-        libtcod.console_print_ex(window, 0, y, libtcod.BKGND_NONE, libtcod.LEFT, text)
-        y += 1
-        letter_index += 1
+        #print the header, with auto-wrap
+        libtcod.console_set_default_foreground(window, libtcod.white)
+        libtcod.console_print_rect_ex(window, 0, 0, width, height, libtcod.BKGND_NONE, libtcod.LEFT, header)
+
+        #print all the options
+        y = header_height
+        letter_index = ord('a')
+        for option_text in options:
+            text = '(' + chr(letter_index) + ') ' + option_text
+            libtcod.console_print_ex(window, 0, y, libtcod.BKGND_NONE, libtcod.LEFT, text)
+            y += 1
+            letter_index += 1
     
     #blit the contents of "window" to the root console
     x = SCREEN_WIDTH/2 - width/2
@@ -968,6 +1593,153 @@ def show_inventory(header):
         if index is None: return None
         else: return inventory[index].item
 
+################################################################################
+# Minimap
+################################################################################
+def downsample(pixels):
+    #halve an [x, y] RGB array by averaging blocks of 2x2, repeating the last
+    #column or row if there's an odd number of them
+    (w, h) = pixels.shape[:2]
+    if w % 2 or h % 2:
+        pixels = numpy.pad(pixels, ((0, w % 2), (0, h % 2), (0, 0)), 'edge')
+    return pixels.reshape(pixels.shape[0] / 2, 2, pixels.shape[1] / 2, 2, 3).mean(axis=(1, 3))
+
+# How many tiles wide a strip of the map reveal() works out at a time, at most
+MINIMAP_STRIP = 256
+
+class Minimap:
+    #a pyramid of ever smaller pictures of the explored map: level l has a
+    #pixel for every 2**l x 2**l tiles. only the levels from the first one
+    #that fits on the screen down are kept, as uint8 RGB; the more detailed
+    #ones are worked out a strip at a time on the way there and thrown away.
+    #revealing tiles only redraws the part of each level over them, so the
+    #minimap costs nothing while nothing new gets explored.
+    def __init__(self):
+        self.map = None
+        self.first = 0
+        self.levels = []
+
+        #goes up whenever the pictures change
+        self.revision = 0
+
+    def reset(self):
+        #start over for the current map
+        self.map = map
+        self.levels = []
+        (w, h) = (map.width, map.height)
+        self.first = 0
+        while w > SCREEN_WIDTH or h > SCREEN_HEIGHT:
+            (w, h) = ((w + 1) / 2, (h + 1) / 2)
+            self.first += 1
+        while True:
+            self.levels.append(numpy.zeros((w, h, 3), dtype=numpy.uint8))
+            if w <= 1 and h <= 1:
+                break
+            (w, h) = ((w + 1) / 2, (h + 1) / 2)
+        if map.explored.any():
+            self.reveal_mask(0, 0, map.explored)
+
+    def reveal(self, x1, y1, x2, y2):
+        #redraw the tiles with x1 <= x < x2 and y1 <= y < y2 on every level
+        if self.map is not map:
+            self.reset()
+            return
+
+        #widen the area to whole pixels of the first level kept, so each
+        #strip halves down to it the same way the whole map would
+        block = 2 ** self.first
+        (x1, y1) = (x1 - x1 % block, y1 - y1 % block)
+        x2 = min(x2 + (-x2) % block, map.width)
+        y2 = min(y2 + (-y2) % block, map.height)
+        strip = max(block, MINIMAP_STRIP)
+        for x in range(x1, x2, strip):
+            self.reveal_strip(x, y1, min(x + strip, x2), y2)
+        self.revision += 1
+
+    def reveal_strip(self, x1, y1, x2, y2):
+        area = numpy.s_[x1:x2, y1:y2]
+        pixels = TILE_BACKGROUND_PALETTE[LIGHT_LIT, map.tile_type[area]].astype(numpy.float32)
+        pixels[~map.explored[area]] = 0
+        for level in range(self.first):
+            pixels = downsample(pixels)
+
+        (x1, y1) = (x1 >> self.first, y1 >> self.first)
+        (x2, y2) = (((x2 - 1) >> self.first) + 1, ((y2 - 1) >> self.first) + 1)
+        self.levels[0][x1:x2, y1:y2] = pixels
+        for level in range(1, len(self.levels)):
+            (x1, y1) = (x1 / 2, y1 / 2)
+            (x2, y2) = ((x2 + 1) / 2, (y2 + 1) / 2)
+            self.levels[level][x1:x2, y1:y2] = downsample(
+                self.levels[level - 1][2 * x1:2 * x2, 2 * y1:2 * y2].astype(numpy.float32))
+
+    def reveal_mask(self, x, y, mask):
+        #redraw around the tiles set in mask, an [x, y] array whose corner
+        #is at (x, y) on the map
+        xs = numpy.nonzero(mask.any(axis=1))[0]
+        ys = numpy.nonzero(mask.any(axis=0))[0]
+        self.reveal(x + xs[0], y + ys[0], x + xs[-1] + 1, y + ys[-1] + 1)
+
+    def fitting_level(self, width, height):
+        #the most detailed level no bigger than width x height (or the
+        #smallest there is)
+        if self.map is not map:
+            self.reset()
+        for (level, pixels) in enumerate(self.levels):
+            if pixels.shape[0] <= width and pixels.shape[1] <= height:
+                return self.first + level
+        return self.first + len(self.levels) - 1
+
+    def pixels(self, level):
+        #the [x, y] RGB picture at a level that's kept
+        return self.levels[level - self.first]
+
+minimap = Minimap()
+
+# The console the minimap is shown on, with the level and revision it shows,
+# and one to keep the screen under it
+minimap_window = [None, None]
+minimap_backup = None
+
+def show_minimap():
+    #show the biggest level of the minimap that fits on the screen, with the
+    #player on it, until a key is pressed
+    global minimap_backup
+
+    level = minimap.fitting_level(SCREEN_WIDTH, SCREEN_HEIGHT)
+    pixels = minimap.pixels(level)
+    (width, height) = pixels.shape[:2]
+
+    #draw the level on its console, unless it's already there
+    (window, drawn_for) = minimap_window
+    if drawn_for != (minimap.map, level, minimap.revision):
+        if drawn_for is None or drawn_for[:2] != (minimap.map, level):
+            if window is not None:
+                libtcod.console_delete(window)
+            window = libtcod.console_new(width, height)
+        rgb = pixels.transpose(1, 0, 2)
+        libtcod.console_fill_background(window, rgb[..., 0].ravel(), rgb[..., 1].ravel(), rgb[..., 2].ravel())
+        minimap_window[:] = [window, (minimap.map, level, minimap.revision)]
+
+    #keep what's on screen, to put it back afterwards
+    if minimap_backup is None:
+        minimap_backup = libtcod.console_new(SCREEN_WIDTH, SCREEN_HEIGHT)
+    libtcod.console_blit(0, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, minimap_backup, 0, 0)
+
+    x = SCREEN_WIDTH/2 - width/2
+    y = SCREEN_HEIGHT/2 - height/2
+    libtcod.console_set_default_background(0, libtcod.black)
+    libtcod.console_clear(0)
+    libtcod.console_blit(window, 0, 0, width, height, 0, x, y)
+    libtcod.console_set_default_foreground(0, libtcod.white)
+    libtcod.console_put_char(0, x + (player.x >> level), y + (player.y >> level), '@', libtcod.BKGND_NONE)
+
+    #present the root console to the player and wait for a key-press
+    libtcod.console_flush()
+    libtcod.console_wait_for_keypress(True)
+
+    libtcod.console_blit(minimap_backup, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
+    libtcod.console_flush()
+
 ################################################################################
 # Field of View
 ################################################################################
@@ -975,67 +1747,444 @@ FOV_ALGO = 0  #default FOV algorithm
 FOV_LIGHT_WALLS = True
 TORCH_RADIUS = 30
 
+# What works out FOV: 'libtcod' for libtcod's map_compute_fov with FOV_ALGO,
+# or 'shadowcast' for shadowcast_fov, which works FOV out with NumPy. The game
+# still needs libtcod.so either way, for the console (the headless one too),
+# the RNG, noise and colours; only FOV stops calling it. shadowcast_fov gives
+# exactly what FOV_SHADOW does in libtcod 1.5.1, the version libtcodpy.py
+# wraps. (libtcod 2.x stops a span once a run of walls has closed it, so it
+# sees a few cells fewer.) Against FOV_BASIC, the FOV_ALGO 0 used here, about
+# 4% of the cells in sight differ, on the edges of shadows; benchmarks/fov.py
+# counts them against the libtcod that's installed. compute_fov takes an
+# engine, so a caller can pick its own; FOV_ENGINE is for the ones that don't.
+FOV_ENGINE = 'libtcod'
+
+# The engine for what the player (and so the monsters they can see) sees
+PLAYER_FOV_ENGINE = FOV_ENGINE
+
 # Do we need to refresh FOV this turn?
 need_fov_refresh = True
 
 # Initialize FOV map
 def make_fov_map():
-    global fov_map
+    global fov_map, fov
     fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
+    fov = None
+
+    #libtcod wants its cells row by row, so hand it the transposed [y, x] arrays
+    libtcod.map_set_properties_array(fov_map, ~map.block_sight.T, ~map.blocked.T)
+
+# With a sight radius, FOV is computed on a small libtcod map covering just the
+# square the radius reaches, copied out of the tile arrays each time, so that
+# its cost depends on the radius and not on the size of the world. Without
+# one (a radius of 0), or with FOV_WINDOWED off, fov_map is used.
+FOV_WINDOWED = True
+
+# The small libtcod maps, by size
+fov_windows = {}
+
+class FieldOfView:
+    #the result of an FOV computation: visible is a [y, x] array of what can
+    #be seen, with its corner at (x, y) on the world map
+    def __init__(self, visible, x, y):
+        self.visible = visible
+        self.x = x
+        self.y = y
+        (self.height, self.width) = visible.shape
+
+    def is_in_fov(self, x, y):
+        x -= self.x
+        y -= self.y
+        return 0 <= x < self.width and 0 <= y < self.height and bool(self.visible[y, x])
+
+    def visible_in(self, x, y, width, height):
+        #what can be seen of a rectangle of the world, as a [y, x] array
+        visible = numpy.zeros((height, width), dtype=numpy.bool_)
+        x1 = max(x, self.x)
+        y1 = max(y, self.y)
+        x2 = min(x + width, self.x + self.width)
+        y2 = min(y + height, self.y + self.height)
+        if x1 < x2 and y1 < y2:
+            visible[y1 - y:y2 - y, x1 - x:x2 - x] = \
+                self.visible[y1 - self.y:y2 - self.y, x1 - self.x:x2 - self.x]
+        return visible
+
+    def objects_in(self, index):
+        #the objects in a SpatialIndex that stand on cells in view. only the
+        #window this FOV covers is looked up, however many objects there are.
+        found = index.in_rect(self.x, self.y, self.x + self.width, self.y + self.height)
+        return [object for object in found if self.visible[object.y - self.y, object.x - self.x]]
+
+    def pack(self):
+        #the same FOV in an eighth of the memory, for the cache
+        return (self.x, self.y, self.visible.shape, numpy.packbits(self.visible))
+
+def unpack_fov(packed):
+    (x, y, shape, bits) = packed
+    visible = numpy.unpackbits(bits)[:shape[0] * shape[1]].reshape(shape).astype(numpy.bool_)
+    return FieldOfView(visible, x, y)
+
+# The last FOV computed from the player
+fov = None
+
+# Recently computed FOVs, packed, least recently used first. They're keyed by
+# (x, y, radius, algorithm, light walls, map revision), so standing still,
+# pacing back and forth or opening and closing a door again finds the FOV here
+# instead of computing it again.
+FOV_CACHE_SIZE = 64
+fov_cache = collections.OrderedDict()
+fov_cache_map = None
+
+def compute_fov(x, y, radius, engine=None):
+    #what can be seen from (x, y), worked out by the given FOV engine
+    global fov_cache_map
+    if engine is None: engine = FOV_ENGINE
+    if fov_cache_map is not map:
+        fov_cache.clear()
+        fov_cache_map = map
+
+    algorithm = FOV_ALGO if engine == 'libtcod' else engine
+    key = (x, y, radius, algorithm, FOV_LIGHT_WALLS, map.revision)
+    if key in fov_cache:
+        packed = fov_cache.pop(key)
+        fov_cache[key] = packed
+        return unpack_fov(packed)
+
+    result = compute_fov_uncached(x, y, radius, engine)
+    fov_cache[key] = result.pack()
+    if len(fov_cache) > FOV_CACHE_SIZE:
+        fov_cache.popitem(last=False)
+    return result
+
+def compute_fov_uncached(x, y, radius, engine='libtcod'):
+    if radius <= 0:
+        #the whole world; shadowcast_fov works out how far that is
+        if engine == 'shadowcast':
+            return FieldOfView(shadowcast_fov(~map.block_sight.T, x, y, 0, FOV_LIGHT_WALLS), 0, 0)
+        libtcod.map_compute_fov(fov_map, x, y, 0, FOV_LIGHT_WALLS, FOV_ALGO)
+        return FieldOfView(libtcod.map_get_fov_array(fov_map), 0, 0)
+
+    if engine == 'shadowcast':
+        (transparent, walkable, x0, y0) = fov_window_arrays(x, y, radius)
+        visible = shadowcast_fov(transparent, radius, radius, radius, FOV_LIGHT_WALLS)
+        return FieldOfView(visible, x0, y0)
+
+    if not FOV_WINDOWED:
+        libtcod.map_compute_fov(fov_map, x, y, radius, FOV_LIGHT_WALLS, FOV_ALGO)
+        return FieldOfView(libtcod.map_get_fov_array(fov_map), 0, 0)
+
+    size = 2 * radius + 1
+    if size not in fov_windows:
+        fov_windows[size] = libtcod.map_new(size, size)
+    window = fov_windows[size]
+
+    (transparent, walkable, x0, y0) = fov_window_arrays(x, y, radius)
+    libtcod.map_set_properties_array(window, transparent, walkable)
+    libtcod.map_compute_fov(window, radius, radius, radius, FOV_LIGHT_WALLS, FOV_ALGO)
+    return FieldOfView(libtcod.map_get_fov_array(window), x0, y0)
+
+def fov_window_arrays(x, y, radius):
+    #the square around (x, y) that the radius reaches, as [y, x] arrays of
+    #what can be seen through and walked on, and its corner. past the edges
+    #of the world it's all wall.
+    size = 2 * radius + 1
+    (x0, y0) = (x - radius, y - radius)
+    x1 = max(x0, 0)
+    y1 = max(y0, 0)
+    x2 = min(x0 + size, map.width)
+    y2 = min(y0 + size, map.height)
+    transparent = numpy.zeros((size, size), dtype=numpy.bool_)
+    walkable = numpy.zeros((size, size), dtype=numpy.bool_)
+    transparent[y1 - y0:y2 - y0, x1 - x0:x2 - x0] = ~map.block_sight[x1:x2, y1:y2].T
+    walkable[y1 - y0:y2 - y0, x1 - x0:x2 - x0] = ~map.blocked[x1:x2, y1:y2].T
+    return (transparent, walkable, x0, y0)
+
+# The eight octants shadowcast_fov sweeps, as the (xx, xy, yx, yy) that turn
+# a cell (dx, dy) of the first one into an offset (dx*xx + dy*xy,
+# dx*yx + dy*yy), in the order libtcod uses
+SHADOWCAST_OCTANTS = [(1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+                      (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)]
+
+def shadowcast_fov(transparent, x, y, radius=0, light_walls=True):
+    #recursive shadowcasting, the way libtcod 1.5.1's FOV_SHADOW does it, on a
+    #[y, x] array of what can be seen through. returns a [y, x] array of what
+    #can be seen from (x, y). rather than recursing, each octant is swept a
+    #row at a time, with the slopes still open kept as (start, end) pairs,
+    #and each pair handled with a few NumPy calls on its slice of the row.
+    #the slopes are float32, like libtcod's, so the results are the same.
+    (height, width) = transparent.shape
+    visible = numpy.zeros((height, width), dtype=numpy.bool_)
+    if radius <= 0:
+        #far enough to reach every corner of the map
+        radius_x = max(width - x, x)
+        radius_y = max(height - y, y)
+        radius = int(math.sqrt(radius_x * radius_x + radius_y * radius_y)) + 1
+    r2 = radius * radius
+    half = numpy.float32(0.5)
+
+    for (xx, xy, yx, yy) in SHADOWCAST_OCTANTS:
+        spans = [(numpy.float32(1.0), numpy.float32(0.0))]
+        for j in range(1, radius + 1):
+            #row j of the octant runs from dx = -j to the axis at dx = 0. cells
+            #off the map are left out, as if they weren't there at all.
+            dx = numpy.arange(-j, 1)
+            cells_x = x + dx * xx - j * xy
+            cells_y = y + dx * yx - j * yy
+            inside = numpy.flatnonzero((cells_x >= 0) & (cells_x < width) &
+                                       (cells_y >= 0) & (cells_y < height))
+            if len(inside) == 0:
+                #the axis cell is off the map, so is every row after this one
+                break
+            row = numpy.s_[inside[0]:inside[-1] + 1]
+            (dx, cells_x, cells_y) = (dx[row], cells_x[row], cells_y[row])
+
+            #the slopes of each cell's two corners; both go down along the row
+            l_slope = (dx.astype(numpy.float32) - half) / (numpy.float32(-j) + half)
+            r_slope = (dx.astype(numpy.float32) + half) / (numpy.float32(-j) - half)
+            opaque = ~transparent[cells_y, cells_x]
+
+            lit = numpy.zeros(len(dx), dtype=numpy.bool_)
+            next_spans = []
+            for (start, end) in spans:
+                #skip the cells wholly past start, stop at the first wholly past end
+                k1 = numpy.searchsorted(-r_slope, -start, 'left')
+                k2 = numpy.searchsorted(-l_slope, -end, 'right')
+                if k1 >= k2:
+                    next_spans.append((start, end))
+                    continue
+                lit[k1:k2] = True
+                if j == radius:
+                    continue
+
+                #each run of walls shadows the next row: the slopes before it
+                #go on as a span of their own, and the ones after it go on
+                #unless the row ends in the run. like libtcod 1.5.1, they go
+                #on even if the run has left start below end.
+                span = opaque[k1:k2]
+                edges = [0] + list(numpy.flatnonzero(span[1:] != span[:-1]) + 1) + [len(span)]
+                for (first, last) in zip(edges[:-1], edges[1:]):
+                    if span[first]:
+                        if start >= l_slope[k1 + first]:
+                            next_spans.append((start, l_slope[k1 + first]))
+                        start = r_slope[k1 + last - 1]
+                if not span[-1]:
+                    next_spans.append((start, end))
+
+            lit &= dx * dx + j * j <= r2
+            if not light_walls:
+                lit &= ~opaque
+            visible[cells_y[lit], cells_x[lit]] = True
+
+            spans = next_spans
+            if not spans:
+                break
+
+    visible[y, x] = True
+    return visible
+
+def visible_actors():
+    #the objects with an AI that the player can see
+    if fov is None:
+        return []
+    return [object for object in fov.objects_in(object_index) if object.ai]
+
+################################################################################
+# Monster movement
+################################################################################
+# Monsters find their way to the player down a flow field: how many steps
+# each tile in the square around the player is from them, worked out once a
+# turn by a breadth-first search over NumPy arrays. Walls, closed doors and
+# furniture are in the way; other monsters aren't, since they'll have moved on
+# by the time anyone gets there. It reaches a bit past what the player can
+# see, so monsters can find their way round buildings.
+FLOW_FIELD_RADIUS = TORCH_RADIUS + 10
+
+# The eight steps a monster can take
+FLOW_STEPS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+class FlowField:
+    #steps to (x, y) from each tile of the square reaching radius tiles
+    #around it, as an [x, y] array with its corner at (self.x, self.y), -1
+    #where there's no way through
+    def __init__(self, x, y, radius):
+        size = 2 * radius + 1
+        (x0, y0) = (x - radius, y - radius)
+        self.x = x0
+        self.y = y0
+        self.target = (x, y)
+        self.size = size
+
+        #what can be walked through; past the edges of the world, nothing
+        x1 = max(x0, 0)
+        y1 = max(y0, 0)
+        x2 = min(x0 + size, map.width)
+        y2 = min(y0 + size, map.height)
+        passable = numpy.zeros((size, size), dtype=numpy.bool_)
+        passable[x1 - x0:x2 - x0, y1 - y0:y2 - y0] = ~map.occupied[x1:x2, y1:y2]
+        #a cell that's only blocked by fighters can be walked through; if a
+        #closed door or anything else that doesn't move is there too, not
+        fighters = {}
+        for object in object_index.in_rect(x1, y1, x2, y2):
+            if object.blocks and object.fighter:
+                fighters[(object.x, object.y)] = fighters.get((object.x, object.y), 0) + 1
+        for ((cell_x, cell_y), count) in fighters.items():
+            passable[cell_x - x0, cell_y - y0] = (not map.blocked[cell_x, cell_y] and
+                                                  map.blockers[cell_x, cell_y] == count)
+
+        #grow out from (x, y) a step at a time, into all eight neighbours
+        self.steps = numpy.empty((size, size), dtype=numpy.int32)
+        self.steps.fill(-1)
+        reached = numpy.zeros((size, size), dtype=numpy.bool_)
+        frontier = reached.copy()
+        frontier[radius, radius] = reached[radius, radius] = True
+        self.steps[radius, radius] = 0
+        distance = 0
+        while frontier.any():
+            distance += 1
+            grown = frontier.copy()
+            grown[1:, :] |= frontier[:-1, :]
+            grown[:-1, :] |= frontier[1:, :]
+            spread = grown.copy()
+            spread[:, 1:] |= grown[:, :-1]
+            spread[:, :-1] |= grown[:, 1:]
+            frontier = spread & passable & ~reached
+            reached |= frontier
+            self.steps[frontier] = distance
+
+    def steps_at(self, x, y):
+        #steps from (x, y) to the target, or -1 if it's off the field or cut off
+        x -= self.x
+        y -= self.y
+        if 0 <= x < self.size and 0 <= y < self.size:
+            return int(self.steps[x, y])
+        return -1
+
+    def next_step(self, x, y):
+        #the (dx, dy) that takes something at (x, y) furthest towards the
+        #target and isn't blocked right now, or None. of equally good steps,
+        #the one that heads most directly at the target wins.
+        here = self.steps_at(x, y)
+        (target_x, target_y) = self.target
+        best = None
+        for (dx, dy) in FLOW_STEPS:
+            steps = self.steps_at(x + dx, y + dy)
+            if steps < 0 or steps >= here or is_blocked(x + dx, y + dy):
+                continue
+            rank = (steps, (target_x - x - dx) ** 2 + (target_y - y - dy) ** 2)
+            if best is None or rank < best[0]:
+                best = (rank, (dx, dy))
+        return best[1] if best is not None else None
+
+# The flow field towards the player for this turn
+player_flow = None
+
+def update_player_flow():
+    global player_flow
+    player_flow = FlowField(player.x, player.y, FLOW_FIELD_RADIUS)
 
 ################################################################################
 # Initialization
 ################################################################################
 font = 'arial20x20.png'
-libtcod.console_set_custom_font (font, libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'python/libtcod tutorial', False)
-libtcod.sys_set_fps(LIMIT_FPS)
 
-# Track game state
-game_state = 'playing'
-player_action = 'None'
+def init_game(generator='outdoor', seed=None):
+    global game_state, player_action, con, panel, panel_drawn_for, cam, viewport
+
+    libtcod.console_set_custom_font (font, libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
+    libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'python/libtcod tutorial', False)
+    libtcod.sys_set_fps(LIMIT_FPS)
+
+    # Track game state
+    game_state = 'playing'
+    player_action = 'None'
 
-# Initialize minor consoles
-con = libtcod.console_new(VIEWPORT_WIDTH, VIEWPORT_HEIGHT)
-panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+    # Initialize minor consoles
+    con = libtcod.console_new(VIEWPORT_WIDTH, VIEWPORT_HEIGHT)
+    panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+    panel_drawn_for = None
 
-cam = Camera(VIEWPORT_WIDTH, VIEWPORT_HEIGHT, MAP_WIDTH, MAP_HEIGHT)
+    cam = Camera(VIEWPORT_WIDTH, VIEWPORT_HEIGHT, MAP_WIDTH, MAP_HEIGHT)
+    viewport = Viewport(VIEWPORT_WIDTH, VIEWPORT_HEIGHT)
 
-make_outdoor_map()
-#make_debug_map()
-make_fov_map()
+    seed = load_world(generator, seed)
+    make_fov_map()
 
-#a warm welcoming message!
-message('Welcome to the end of the world...', libtcod.red)
+    #a warm welcoming message! and the seed, so this world can be visited
+    #again with --seed
+    message('Welcome to the end of the world...', libtcod.red)
+    message('World seed: %d' % seed)
 
 ################################################################################
 # Event Loop
 ################################################################################
-while not libtcod.console_is_window_closed():
-
+def render_frame():
     # Render
     libtcod.console_set_default_foreground(0, libtcod.white)
     cam.center(player)
     render_all()
     libtcod.console_flush()
 
-    # Clear objects from screen on next tick to prevent ghosting
-    for object in objects:
-        object.clear()
+# How the main loop runs: 'events' sleeps until a key is pressed and only draws
+# after something happened, 'fixed' draws LIMIT_FPS frames a second whether or
+# not anything did (for animations). --fixed-rate picks 'fixed'.
+LOOP_MODE = 'events'
+
+def play_turn(key):
+    global player_action
 
     # Handle user input
-    player_action = handle_keys()
+    player_action = handle_keys(key)
 
-    #let monsters take their turn
+    #let the monsters the player can see take their turn. the rest don't
+    #know the player is there, so they're never even looked at.
     if game_state == 'playing' and player_action != 'didnt-take-turn':
-        for object in objects:
+        actors = visible_actors()
+        if actors:
+            update_player_flow()
+        for object in actors:
             if object.ai:
                 object.ai.take_turn()
 
-    if player_action == 'exit':
-        break
-
-
+def play_game():
+    if LOOP_MODE == 'fixed':
+        while not libtcod.console_is_window_closed():
+            render_frame()
+            play_turn(libtcod.console_check_for_keypress(True))
+            if player_action == 'exit':
+                break
+        return
+
+    key = libtcod.Key()
+    mouse = libtcod.Mouse()
+    render_frame()
+    while not libtcod.console_is_window_closed():
+        libtcod.sys_wait_for_event(libtcod.EVENT_KEY_PRESS, key, mouse, False)
+        play_turn(key)
+        if player_action == 'exit':
+            break
+
+        #keys that don't do anything don't need a new frame
+        if player_action != 'didnt-take-turn':
+            render_frame()
+
+if __name__ == '__main__':
+    if '--fixed-rate' in sys.argv:
+        LOOP_MODE = 'fixed'
+
+    seed = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--seed='):
+            seed = int(arg[len('--seed='):])
+
+    init_game(seed=seed)
+
+    if HEADLESS:
+        for arg in sys.argv[1:]:
+            if arg.startswith('--keys='):
+                with open(arg[len('--keys='):]) as keys:
+                    libtcod.queue_keys(keys.read())
+
+    play_game()
+
+    if HEADLESS:
+        print libtcod.console_as_text(libtcod.last_frame)
@@ -0,0 +1,68 @@
+################################################################################
+# Chunked generation tests
+################################################################################
+# The same seed has to make the same world however many worker processes the
+# chunks are shared out over.
+#
+#   python -m unittest discover tests
+import os
+import sys
+import imp
+import unittest
+
+import numpy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAME_SCRIPT = os.path.join(ROOT, 'roguelike-python-tutorial.py')
+
+def load_game():
+    #like benchmarks/common.py: load the script by path, headless, from the
+    #top of the repository so libtcodpy finds ./libtcod.so
+    os.environ['ROGUELIKE_HEADLESS'] = '1'
+    os.chdir(ROOT)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return imp.load_source('roguelike', GAME_SCRIPT)
+
+rl = load_game()
+
+def generate(generator, seed, processes):
+    #the world a seed makes with this many workers, as plain arrays and lists
+    #161 doesn't split evenly, so the chunks aren't all the same size
+    rl.MAP_WIDTH = rl.MAP_HEIGHT = 161
+    rl.MAX_ROOMS = 450
+    rl.GENERATION_CHUNK_SIZE = 40
+    rl.GENERATION_PROCESSES = processes
+    rl.WORLD_CACHE_DIR = None
+    rl.load_world(generator, seed)
+    spawned = [(object.kind, object.x, object.y) for object in rl.objects if object.kind is not None]
+    return {
+        'blocked': rl.map.blocked.copy(),
+        'block_sight': rl.map.block_sight.copy(),
+        'tile_type': rl.map.tile_type.copy(),
+        'spawned': spawned,
+        'player': (rl.player.x, rl.player.y),
+        'max_rooms': rl.MAX_ROOMS,
+    }
+
+class ChunkedGenerationTest(unittest.TestCase):
+    def check_same_world(self, generator):
+        one = generate(generator, 1234, 1)
+        many = generate(generator, 1234, 4)
+        for key in ['blocked', 'block_sight', 'tile_type']:
+            self.assertTrue(numpy.array_equal(one[key], many[key]), key)
+        self.assertEqual(one['spawned'], many['spawned'])
+        self.assertEqual(one['player'], many['player'])
+
+        #and the world's settings are left as they were
+        self.assertEqual(many['max_rooms'], 450)
+        self.assertEqual((rl.MAP_WIDTH, rl.MAP_HEIGHT), (161, 161))
+
+    def test_dungeon(self):
+        self.check_same_world('dungeon')
+
+    def test_outdoor(self):
+        self.check_same_world('outdoor')
+
+if __name__ == '__main__':
+    unittest.main()